@@ -0,0 +1,39 @@
+"""Maintenance commands.
+
+    python -m app.cli rebuild-stats              # reconcile every user's counters
+    python -m app.cli rebuild-stats --user-id 7  # just one user
+"""
+import argparse
+import asyncio
+from .database import async_engine, dispose_async_engines, init_db
+from .services.stats_service import stats_service
+
+
+def rebuild_stats(args: argparse.Namespace) -> None:
+    """Recount user_stats from the source tables and fix any drift"""
+    async def run() -> int:
+        try:
+            await init_db()
+            async with async_engine.begin() as conn:
+                return await conn.run_sync(stats_service.reconcile, args.user_id or None)
+        finally:
+            await dispose_async_engines()
+    
+    fixed = asyncio.run(run())
+    print(f"user_stats reconciled: {fixed} row(s) written")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Student Learning Buddy maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    rebuild = commands.add_parser("rebuild-stats", help="Recount per-user analytics counters")
+    rebuild.add_argument("--user-id", type=int, action="append", help="Only this user (repeatable)")
+    rebuild.set_defaults(handler=rebuild_stats)
+    
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -15,17 +15,74 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str = "sqlite:///./student_buddy.db"
+    ASYNC_DATABASE_URL: str = ""  # derived from DATABASE_URL (aiosqlite/asyncpg) when empty
+    DB_POOL_TIMEOUT_SECONDS: int = 30
+    
+    # SQLite production profile: WAL, tuned pragmas, reader pool plus a serialized writer
+    SQLITE_PRODUCTION_MODE: bool = True
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 268435456  # 256MB
+    SQLITE_CACHE_SIZE_KB: int = 16384  # per connection
+    SQLITE_READ_POOL_SIZE: int = 8
+    SQLITE_READ_MAX_OVERFLOW: int = -1  # extra readers opened under bursts; -1 is unbounded
+    SQLITE_WRITE_POOL_SIZE: int = 1
+    
+    # Write-behind persistence of questions, notes and quizzes (single-process SQLite only)
+    WRITE_BEHIND_ENABLED: bool = False
+    WRITE_BEHIND_BATCH_SIZE: int = 100
+    WRITE_BEHIND_FLUSH_INTERVAL_MS: int = 50
+    
+    # Per-user rate limiting: token buckets where model-backed requests cost more
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_CAPACITY: float = 300.0  # tokens, the largest burst one user can spend
+    RATE_LIMIT_REFILL_PER_SECOND: float = 1.0
+    RATE_LIMIT_COST_DEFAULT: float = 1.0  # every authenticated request
+    RATE_LIMIT_COST_AI: float = 5.0  # extra per model call; per question for batches
+    RATE_LIMIT_STORE: str = "memory"  # memory, or sqlite to share buckets across workers on one host
+    RATE_LIMIT_DB_PATH: str = "./cache/rate_limits.db"
+    
+    # Authenticated-user cache
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
     
     # Google Gemini
-    GEMINI_API_KEY: str
+    GEMINI_API_KEY: str = ""
     GEMINI_MODEL: str = "gemini-pro"
     
+    # LLM backend: "gemini", or "fake" for offline load testing
+    AI_BACKEND: str = "gemini"
+    FAKE_LLM_LATENCY_DISTRIBUTION: str = "lognormal"  # lognormal, normal, uniform, exponential, constant
+    FAKE_LLM_LATENCY_MEAN_MS: float = 800.0
+    FAKE_LLM_LATENCY_STDDEV_MS: float = 300.0
+    FAKE_LLM_ERROR_RATE: float = 0.0
+    FAKE_LLM_RATE_LIMIT_SHARE: float = 0.5  # share of fake errors returned as 429 rather than 503
+    FAKE_LLM_SEED: Optional[int] = None
+    
     # CORS
     CORS_ORIGINS: str = "http://localhost:3000,http://localhost:5173"
     
     # File Upload
     MAX_UPLOAD_SIZE: int = 10485760  # 10MB
     ALLOWED_EXTENSIONS: str = ".pdf,.docx,.txt"
+    MAX_FORM_OVERHEAD: int = 1048576  # request body allowance for form fields on top of MAX_UPLOAD_SIZE
+    UPLOAD_CHUNK_SIZE: int = 65536
+    UPLOAD_SPOOL_THRESHOLD: int = 1048576  # uploads larger than this are spooled to a temp file
+    UPLOAD_TMP_DIR: str = ""  # system temp dir when empty
+    
+    # Text extraction: PDF/DOCX parsing runs in a process pool
+    EXTRACTION_WORKERS: int = 2
+    EXTRACTION_TIMEOUT_SECONDS: float = 30.0  # per file, including time queued for a worker
+    EXTRACTION_MAX_PAGES: int = 500
+    EXTRACTION_MAX_CHARS: int = 2000000
+    
+    # Quiz grading
+    QUIZ_BULK_MAX_ATTEMPTS: int = 500  # attempts accepted by one bulk grading request
+    
+    # Extracted text cache: parsed PDF/DOCX text on disk, keyed by upload SHA-256
+    TEXT_CACHE_ENABLED: bool = True
+    TEXT_CACHE_DIR: str = "./cache/extracted_text"
+    TEXT_CACHE_MAX_BYTES: int = 268435456  # 256MB, least recently used files evicted first
     
     @property
     def allowed_extensions_list(self) -> List[str]:
@@ -35,7 +92,54 @@ class Settings(BaseSettings):
     AI_TEMPERATURE: float = 0.7
     AI_MAX_TOKENS: int = 2048
     AI_RETRY_ATTEMPTS: int = 3
-    AI_RETRY_DELAY: int = 1
+    AI_RETRY_DELAY: int = 1  # base of the jittered exponential backoff, seconds
+    AI_RETRY_MAX_DELAY: float = 8.0
+    AI_RETRY_BUDGET_RATIO: float = 0.2  # retries earned per upstream call
+    AI_RETRY_BUDGET_MAX_TOKENS: float = 10.0  # retries banked for bursts
+    AI_CALL_DEADLINE_SECONDS: float = 60.0  # per call, including queueing, retries and backoff
+    AI_MAX_CONCURRENCY: int = 8  # ceiling of the adaptive concurrency limit
+    AI_MIN_CONCURRENCY: int = 1
+    AI_CONCURRENCY_DECREASE_RATIO: float = 0.5  # limit multiplier on a 429 or 5xx
+    AI_BREAKER_FAILURE_THRESHOLD: int = 5  # consecutive 5xx/timeouts that open the circuit
+    AI_BREAKER_RESET_SECONDS: float = 30.0  # open time before a half-open probe
+    
+    # AI Response Cache
+    AI_CACHE_ENABLED: bool = True
+    AI_CACHE_MAX_ENTRIES: int = 1000
+    AI_CACHE_TTL_SECONDS: int = 86400
+    AI_CACHE_DB_PATH: str = ""  # e.g. ./cache/ai_responses.db to persist across restarts
+    AI_SINGLE_FLIGHT_ENABLED: bool = True
+    
+    # Prompt packing: short questions asked within a few milliseconds share one upstream call
+    AI_PACKING_ENABLED: bool = False
+    AI_PACKING_WINDOW_MS: float = 5.0
+    AI_PACKING_MAX_BATCH: int = 8
+    AI_PACKING_MAX_QUESTION_CHARS: int = 300  # longer questions are always asked on their own
+    
+    # Semantic Question Cache
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.9
+    SEMANTIC_CACHE_DIMENSIONS: int = 2048
+    # Per explanation_type, held as two dense float32 matrices of MAX_ENTRIES x DIMENSIONS:
+    # about 80MB per type and 250MB per worker at the defaults
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 5000
+    
+    # Long Document Summarization
+    SUMMARY_CHUNK_SIZE: int = 8000
+    SUMMARY_MAX_PARALLEL: int = 4
+    
+    # Batch Question Answering
+    QUESTION_BATCH_MAX_ITEMS: int = 50
+    QUESTION_BATCH_MAX_PARALLEL: int = 8  # per request, within AI_MAX_CONCURRENCY
+    
+    # Note Document Storage
+    DOCUMENT_COMPRESSION: str = "zlib"  # zlib, or zstd when the zstandard package is installed
+    DOCUMENT_COMPRESSION_LEVEL: int = 6
+    
+    # Voice Sessions
+    VOICE_CONTEXT_TOKEN_BUDGET: int = 1500  # recent turns plus rolling summary sent with each message
+    VOICE_SUMMARY_EVERY: int = 8  # fold older turns into the summary every K turns
+    VOICE_SUMMARY_KEEP_RECENT: int = 4  # newest turns always sent verbatim
     
     @property
     def cors_origins_list(self) -> List[str]:
@@ -1,11 +1,141 @@
-from sqlalchemy import create_engine
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from .config import settings
 
-engine = create_engine(
+IS_SQLITE = settings.DATABASE_URL.startswith("sqlite")
+# WAL and a separate reader pool need a database file; in-memory databases are per connection
+SQLITE_PRODUCTION_MODE = (
+    IS_SQLITE
+    and settings.SQLITE_PRODUCTION_MODE
+    and ":memory:" not in settings.DATABASE_URL
+    and settings.DATABASE_URL not in ("sqlite://", "sqlite:///")
+)
+
+
+def _async_database_url() -> str:
+    """DATABASE_URL with its async driver (aiosqlite, asyncpg) unless ASYNC_DATABASE_URL is set"""
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    url = settings.DATABASE_URL
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+ASYNC_DATABASE_URL = _async_database_url()
+
+
+def _create_sqlite_engine(pool_size: int, max_overflow: int, read_only: bool) -> AsyncEngine:
+    """File-backed SQLite engine with the production pragmas applied to every connection"""
+    created = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000},
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS
+    )
+    sqlite_engine = created.sync_engine
+    
+    @event.listens_for(sqlite_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        # Transactions are begun explicitly below rather than by the driver
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+    
+    if not read_only:
+        @event.listens_for(sqlite_engine, "begin")
+        def _begin_immediate(conn):
+            # Take the write lock up front so concurrent writers queue on
+            # busy_timeout instead of failing with "database is locked" on upgrade
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+    
+    # Readers stay in autocommit: every statement sees the latest commit and no
+    # read snapshot is held open across an await, which would also stall WAL checkpoints
+    return created
+
+
+if SQLITE_PRODUCTION_MODE:
+    # One serialized writer connection plus a pool of readers; WAL lets
+    # readers run alongside the writer. Startup, background jobs and the CLI
+    # write through this engine too, so there is never a second writer
+    async_engine = _create_sqlite_engine(settings.SQLITE_WRITE_POOL_SIZE, 0, read_only=False)
+    async_read_engine = _create_sqlite_engine(
+        settings.SQLITE_READ_POOL_SIZE,
+        settings.SQLITE_READ_MAX_OVERFLOW,
+        read_only=True
+    )
+else:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args={"check_same_thread": False} if IS_SQLITE else {}
+    )
+    async_read_engine = async_engine
+
+# Synchronous fallback for sync code and scripts. Not created in SQLite
+# production mode, where a second writer pool would defeat the single writer
+engine: Optional[Engine] = None if SQLITE_PRODUCTION_MODE else create_engine(
     settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if IS_SQLITE else {}
+)
+
+
+class RoutingSession(Session):
+    """Sync session behind AsyncSession that reads through async_read_engine and writes through async_engine.
+    
+    Flushes, DML statements and explicit connection() calls go to the
+    writer. Once a transaction has used the writer, its remaining reads do
+    too so they see its own uncommitted changes.
+    """
+    
+    writer_engine: Engine = async_engine.sync_engine
+    reader_engine: Engine = async_read_engine.sync_engine
+    reads_routed = 0
+    writes_routed = 0
+    
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if (
+            self.info.get("uses_writer")
+            or self._flushing
+            or (mapper is None and clause is None)
+            or getattr(clause, "is_dml", False)
+        ):
+            if not self.info.get("uses_writer"):
+                self.info["uses_writer"] = True
+                RoutingSession.writes_routed += 1
+            return self.writer_engine
+        RoutingSession.reads_routed += 1
+        return self.reader_engine
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _release_writer(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("uses_writer", None)
+
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    sync_session_class=RoutingSession if async_read_engine is not async_engine else Session,
+    autoflush=False,
+    # Objects stay usable after commit without an implicit (and async-unsafe) reload
+    expire_on_commit=False
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -13,7 +143,10 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
-def get_db():
+def get_db() -> Iterator[Session]:
+    """Synchronous session, for sync routes and scripts outside SQLite production mode"""
+    if engine is None:
+        raise RuntimeError("The synchronous session is disabled in SQLite production mode; use get_async_db")
     db = SessionLocal()
     try:
         yield db
@@ -21,5 +154,51 @@ def get_db():
         db.close()
 
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """AsyncSession used by the routers"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _pool_stats(pool_engine: Engine) -> Dict[str, Any]:
+    pool = pool_engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+
+
+def database_stats() -> Dict[str, Any]:
+    """Connection pool usage and read/write routing counts"""
+    if async_read_engine is async_engine:
+        return {
+            "mode": "single",
+            "pool": _pool_stats(async_engine.sync_engine),
+        }
+    return {
+        "mode": "sqlite_read_write_split",
+        "writer": _pool_stats(async_engine.sync_engine),
+        "readers": _pool_stats(async_read_engine.sync_engine),
+        "reads_routed": RoutingSession.reads_routed,
+        "writer_transactions": RoutingSession.writes_routed,
+    }
+
+
+async def dispose_async_engines() -> None:
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
+
+async def init_db() -> None:
+    from .migrations import run_migrations
+    
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(run_migrations)
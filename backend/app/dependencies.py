@@ -1,34 +1,89 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from .database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import settings
+from .database import AsyncSessionLocal, get_async_db
 from .services.auth_service import AuthService
+from .services.auth_cache import auth_cache
+from .services.rate_limiter import rate_limiter
+from .services.write_behind import write_behind
 from .models import User
+from .schemas import UserPrincipal
 
 security = HTTPBearer()
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Dependency to get current authenticated user"""
+def _credentials_error(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> UserPrincipal:
+    """Dependency to get the authenticated user's id and email, cached per token and user"""
     token = credentials.credentials
-    token_data = AuthService.verify_token(token)
+    user_id = auth_cache.get_token(token)
+    if user_id is None:
+        token_data = AuthService.verify_token(token)
+        if token_data is None or token_data.user_id is None:
+            raise _credentials_error("Could not validate credentials")
+        user_id = token_data.user_id
+        auth_cache.put_token(token, user_id, token_data.expires_at)
+    
+    principal = auth_cache.get_user(user_id)
+    if principal is None:
+        version = auth_cache.user_version(user_id)
+        # Short-lived session so the request's own session holds no connection yet
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(
+                select(User.id, User.email).where(User.id == user_id)
+            )).first()
+        if row is None:
+            raise _credentials_error("User not found")
+        principal = UserPrincipal(id=row.id, email=row.email)
+        auth_cache.put_user(principal, version)
+    
+    return principal
+
+
+async def get_synced_principal(
+    principal: UserPrincipal = Depends(get_current_principal)
+) -> UserPrincipal:
+    """get_current_principal for reads: the user's write-behind rows are committed first"""
+    await write_behind.sync_user(principal.id)
+    return principal
+
+
+class RateLimit:
+    """Dependency that charges cost to the user's rate limit bucket, 429 when it is empty"""
     
-    if token_data is None or token_data.user_id is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    def __init__(self, cost: float):
+        self.cost = cost
     
-    user = AuthService.get_user_by_id(db, user_id=token_data.user_id)
+    async def __call__(self, principal: UserPrincipal = Depends(get_current_principal)) -> UserPrincipal:
+        await rate_limiter.enforce(principal.id, self.cost)
+        return principal
+
+
+# Every authenticated request
+rate_limit = RateLimit(settings.RATE_LIMIT_COST_DEFAULT)
+# Instead of rate_limit on routes that call the model, so the request is one take
+ai_rate_limit = RateLimit(settings.RATE_LIMIT_COST_DEFAULT + settings.RATE_LIMIT_COST_AI)
+
+
+async def get_current_user(
+    principal: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Dependency to get current authenticated user as a full ORM object"""
+    user = await db.get(User, principal.id)
     if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        auth_cache.invalidate_user(principal.id)
+        raise _credentials_error("User not found")
     
     return user
@@ -0,0 +1,203 @@
+"""End-to-end load test for the API.
+
+Drives signup -> ask -> generate quiz -> attempt -> summarize -> voice flows
+at a target concurrency and reports throughput plus p50/p95/p99 latency per
+endpoint. By default the app runs in-process against the fake LLM backend,
+so no Gemini quota is used:
+
+    python -m app.loadtest --concurrency 50 --duration 60
+
+Point it at a running server instead with --base-url.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+
+
+TOPICS = [
+    "photosynthesis", "the water cycle", "Newton's laws of motion", "cell division",
+    "the French Revolution", "supply and demand", "chemical bonding", "plate tectonics",
+    "the structure of DNA", "electric circuits", "the Pythagorean theorem", "climate change"
+]
+
+SAMPLE_TEXT = (
+    "Photosynthesis is the process by which green plants and some other organisms use sunlight "
+    "to synthesize foods from carbon dioxide and water. It generally involves the green pigment "
+    "chlorophyll and generates oxygen as a byproduct. "
+) * 20
+
+
+class LatencyRecorder:
+    """Collects per-endpoint latencies and error counts"""
+    
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+    
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+    
+    @staticmethod
+    def percentile(values: List[float], pct: float) -> float:
+        """Nearest-rank percentile"""
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        rank = max(int(round(pct / 100.0 * len(ordered) + 0.5)) - 1, 0)
+        return ordered[min(rank, len(ordered) - 1)]
+    
+    def report(self, elapsed: float) -> Dict[str, object]:
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": self.errors.get(endpoint, 0),
+                "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(self.percentile(values, 50) * 1000, 1),
+                "p95_ms": round(self.percentile(values, 95) * 1000, 1),
+                "p99_ms": round(self.percentile(values, 99) * 1000, 1),
+                "max_ms": round(max(values) * 1000, 1),
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "total_requests": total,
+            "total_errors": sum(self.errors.values()),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+async def timed(client: httpx.AsyncClient, recorder: LatencyRecorder, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+    """Issue one request and record its latency under the endpoint name"""
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError:
+        recorder.record(endpoint, time.perf_counter() - start, ok=False)
+        return None
+    recorder.record(endpoint, time.perf_counter() - start, ok=response.status_code < 400)
+    return response
+
+
+async def run_flow(client: httpx.AsyncClient, recorder: LatencyRecorder, rng: random.Random) -> None:
+    """One student session: signup, ask, quiz, attempt, summarize, voice"""
+    email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+    response = await timed(client, recorder, "POST /auth/signup", "POST", "/auth/signup",
+                           json={"email": email, "password": "loadtest-password"})
+    if response is None or response.status_code != 201:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    topic = rng.choice(TOPICS)
+    
+    await timed(client, recorder, "POST /questions/ask", "POST", "/questions/ask", headers=headers,
+                json={"question": f"Can you explain {topic}?",
+                      "explanation_type": rng.choice(["simple", "exam", "real_world"])})
+    
+    response = await timed(client, recorder, "POST /quizzes/generate", "POST", "/quizzes/generate",
+                           headers=headers, data={"topic": topic, "difficulty": "medium", "question_count": "5"})
+    if response is not None and response.status_code == 201:
+        quiz = response.json()
+        answers = [
+            {"question_id": q.get("id"), "answer": rng.choice(q.get("options") or [q.get("correct_answer")])}
+            for q in quiz.get("questions", [])
+        ]
+        await timed(client, recorder, "POST /quizzes/attempts", "POST", "/quizzes/attempts", headers=headers,
+                    json={"quiz_id": quiz["id"], "answers": answers, "time_taken": rng.randint(30, 300)})
+    
+    await timed(client, recorder, "POST /notes/summarize", "POST", "/notes/summarize", headers=headers,
+                data={"title": f"Notes on {topic}", "format": "bullet_points", "text_content": SAMPLE_TEXT})
+    
+    response = await timed(client, recorder, "POST /voice/sessions", "POST", "/voice/sessions",
+                           headers=headers, json={"mode": "casual"})
+    if response is not None and response.status_code == 201:
+        session_id = response.json()["id"]
+        for _ in range(2):
+            await timed(client, recorder, "POST /voice/sessions/{id}/message", "POST",
+                        f"/voice/sessions/{session_id}/message", headers=headers,
+                        json={"content": f"I have been studying {topic} this week.", "mode": "casual"})
+        await timed(client, recorder, "PUT /voice/sessions/{id}/end", "PUT",
+                    f"/voice/sessions/{session_id}/end", headers=headers)
+    
+    await timed(client, recorder, "GET /analytics/stats", "GET", "/analytics/stats", headers=headers)
+
+
+async def run_load_test(client: httpx.AsyncClient, concurrency: int, duration: float, flows: Optional[int], seed: int) -> Dict[str, object]:
+    """Run flows from `concurrency` virtual users until the duration or flow budget is spent"""
+    recorder = LatencyRecorder()
+    deadline = time.perf_counter() + duration
+    remaining = [flows] if flows else None
+    
+    async def virtual_user(index: int) -> None:
+        rng = random.Random(seed + index)
+        while time.perf_counter() < deadline:
+            if remaining is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            await run_flow(client, recorder, rng)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(virtual_user(i) for i in range(concurrency)))
+    return recorder.report(time.perf_counter() - start)
+
+
+def print_report(report: Dict[str, object]) -> None:
+    print(f"\nElapsed: {report['elapsed_seconds']}s  Requests: {report['total_requests']}  "
+          f"Errors: {report['total_errors']}  Throughput: {report['throughput_rps']} req/s\n")
+    header = f"{'endpoint':<38}{'reqs':>7}{'errs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:<38}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>9}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+
+
+async def main_async(args: argparse.Namespace) -> Dict[str, object]:
+    timeout = httpx.Timeout(args.timeout)
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as client:
+            return await run_load_test(client, args.concurrency, args.duration, args.flows, args.seed)
+    
+    # In-process run: settings are read at import time, so configure before importing the app
+    os.environ.setdefault("AI_BACKEND", "fake")
+    os.environ.setdefault("SECRET_KEY", "loadtest-secret-key")
+    os.environ.setdefault("DATABASE_URL", "sqlite:///./loadtest.db")
+    from .main import app
+    
+    # Run the app's startup and shutdown hooks (init_db, write-behind queue) around the test
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+            return await run_load_test(client, args.concurrency, args.duration, args.flows, args.seed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the Student Learning Buddy API")
+    parser.add_argument("--base-url", help="Target a running server instead of the in-process app")
+    parser.add_argument("--concurrency", type=int, default=10, help="Number of concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Test duration in seconds")
+    parser.add_argument("--flows", type=int, default=None, help="Stop after this many complete flows")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    
+    report = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .config import settings
-from .database import init_db
-from .routers import auth, profile, questions, quizzes, notes, voice, analytics
+from .database import dispose_async_engines, init_db
+from .middleware import BodySizeLimitMiddleware
+from .pagination import NEXT_CURSOR_HEADER
+from .routers import auth, profile, questions, quizzes, notes, voice, analytics, metrics
+from .services.file_service import file_service
+from .services.write_behind import write_behind
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -10,6 +14,13 @@ app = FastAPI(
     description="AI-powered educational platform for students"
 )
 
+# Oversized uploads are refused before they are parsed and spooled
+# Registered first so CORS wraps it and a 413 still carries CORS headers
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_body_size=settings.MAX_UPLOAD_SIZE + settings.MAX_FORM_OVERHEAD
+)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -17,6 +28,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Include routers
@@ -27,12 +39,22 @@ app.include_router(quizzes.router)
 app.include_router(notes.router)
 app.include_router(voice.router)
 app.include_router(analytics.router)
+app.include_router(metrics.router)
 
 
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     """Initialize database on startup"""
-    init_db()
+    await init_db()
+    await write_behind.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write queued rows, close pooled async database connections and stop extraction workers"""
+    await write_behind.close()
+    await dispose_async_engines()
+    file_service.shutdown()
 
 
 @app.get("/")
@@ -0,0 +1,65 @@
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class RequestTooLarge(HTTPException):
+    def __init__(self, max_body_size: int):
+        super().__init__(
+            status_code=413,
+            detail=f"Request body is larger than {max_body_size} bytes"
+        )
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies over a byte limit before the app buffers them.
+
+    A declared Content-Length over the limit is refused without reading the
+    body. Otherwise bytes are counted as they arrive and the request fails as
+    soon as the count passes the limit, which also covers chunked uploads.
+    """
+    
+    def __init__(self, app: ASGIApp, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self._reject(scope, receive, send)
+            return
+        
+        received = 0
+        response_started = False
+        
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # An HTTPException, so the app's handlers turn it into a 413 response
+                    raise RequestTooLarge(self.max_body_size)
+            return message
+        
+        async def tracked_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except RequestTooLarge:
+            if response_started:
+                raise
+            await self._reject(scope, receive, send)
+    
+    async def _reject(self, scope: Scope, receive: Receive, send: Send) -> None:
+        error = RequestTooLarge(self.max_body_size)
+        response = JSONResponse({"detail": error.detail}, status_code=error.status_code, headers={"Connection": "close"})
+        await response(scope, receive, send)
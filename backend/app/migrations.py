@@ -0,0 +1,143 @@
+"""Idempotent schema and data migrations run at startup after create_all.
+
+create_all only creates missing tables, so columns and indexes added to
+existing tables, and data moved between tables, are handled here.
+"""
+from datetime import datetime
+from sqlalchemy import String, cast, func, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection
+from .database import Base
+from .models import Note, Quiz, VoiceSession, VoiceSessionMessage
+from .services.document_store import document_store
+from .services.grading_service import grading_service
+from .services.stats_service import stats_service
+
+
+def _add_missing_columns(conn: Connection) -> None:
+    """ALTER TABLE ... ADD COLUMN for model columns missing from existing tables"""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+            if column.server_default is not None:
+                default = column.server_default.arg
+                ddl += f" DEFAULT '{default}'" if isinstance(default, str) else f" DEFAULT {default.text}"
+            conn.execute(text(ddl))
+
+
+def _create_missing_indexes(conn: Connection) -> None:
+    """Create model indexes missing from existing tables"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+def _migrate_voice_messages(conn: Connection, batch_size: int = 200) -> None:
+    """Move JSON voice_sessions.messages histories into voice_messages rows"""
+    sessions_table = VoiceSession.__table__
+    messages_table = VoiceSessionMessage.__table__
+    last_id = 0
+    while True:
+        sessions = conn.execute(
+            select(sessions_table.c.id, sessions_table.c.messages)
+            .where(
+                sessions_table.c.id > last_id,
+                sessions_table.c.messages.isnot(None),
+                cast(sessions_table.c.messages, String).notin_(["[]", "null"])
+            )
+            .order_by(sessions_table.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not sessions:
+            return
+        
+        for session_id, messages in sessions:
+            last_id = session_id
+            seq = conn.execute(
+                select(func.coalesce(func.max(messages_table.c.seq), 0))
+                .where(messages_table.c.session_id == session_id)
+            ).scalar()
+            rows = []
+            for message in messages or []:
+                seq += 1
+                try:
+                    created_at = datetime.fromisoformat(message.get("timestamp"))
+                except (TypeError, ValueError):
+                    created_at = datetime.utcnow()
+                rows.append({
+                    "session_id": session_id,
+                    "seq": seq,
+                    "role": message.get("role", "user"),
+                    "content": message.get("content", ""),
+                    "created_at": created_at
+                })
+            if rows:
+                conn.execute(insert(messages_table), rows)
+            conn.execute(
+                update(sessions_table)
+                .where(sessions_table.c.id == session_id)
+                .values(messages=[], message_count=seq)
+            )
+
+
+def _migrate_note_documents(conn: Connection, batch_size: int = 100) -> None:
+    """Move inline notes.original_text into deduplicated, compressed documents"""
+    notes_table = Note.__table__
+    while True:
+        notes = conn.execute(
+            select(notes_table.c.id, notes_table.c.original_text)
+            .where(notes_table.c.document_hash.is_(None), notes_table.c.original_text != "")
+            .order_by(notes_table.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not notes:
+            return
+        for note_id, original_text in notes:
+            conn.execute(
+                update(notes_table)
+                .where(notes_table.c.id == note_id)
+                .values(document_hash=document_store.put(conn, original_text), original_text="")
+            )
+
+
+def _backfill_quiz_answer_keys(conn: Connection, batch_size: int = 200) -> None:
+    """Build answer keys for quizzes created before quizzes.answer_key existed"""
+    quizzes_table = Quiz.__table__
+    while True:
+        quizzes = conn.execute(
+            select(quizzes_table.c.id, quizzes_table.c.questions)
+            .where(quizzes_table.c.answer_key.is_(None))
+            .order_by(quizzes_table.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not quizzes:
+            return
+        for quiz_id, questions in quizzes:
+            conn.execute(
+                update(quizzes_table)
+                .where(quizzes_table.c.id == quiz_id)
+                .values(answer_key=grading_service.build_answer_key(questions))
+            )
+
+
+def _backfill_user_stats(conn: Connection, batch_size: int = 500) -> None:
+    """Create user_stats rows for users that predate the table"""
+    missing = stats_service.missing_user_ids(conn)
+    for start in range(0, len(missing), batch_size):
+        stats_service.reconcile(conn, missing[start:start + batch_size])
+
+
+def run_migrations(conn: Connection) -> None:
+    """Bring an existing database up to date with the models, in the caller's transaction"""
+    _add_missing_columns(conn)
+    _create_missing_indexes(conn)
+    _migrate_voice_messages(conn)
+    _migrate_note_documents(conn)
+    _backfill_quiz_answer_keys(conn)
+    _backfill_user_stats(conn)
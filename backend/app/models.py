@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey, DateTime, JSON, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -51,6 +51,11 @@ class Question(Base):
     confidence_score = Column(Float)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
+    # Keyset pagination of a user's history: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+    __table_args__ = (
+        Index("ix_questions_user_created_id", user_id, created_at.desc(), id.desc()),
+    )
+    
     user = relationship("User", back_populates="questions")
 
 
@@ -64,8 +69,14 @@ class Quiz(Base):
     difficulty = Column(String(50))
     question_count = Column(Integer)
     questions = Column(JSON, nullable=False)
+    # str(question id) -> normalized and original correct answer plus explanation, built at creation
+    answer_key = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
+    __table_args__ = (
+        Index("ix_quizzes_user_created_id", user_id, created_at.desc(), id.desc()),
+    )
+    
     user = relationship("User", back_populates="quizzes")
     attempts = relationship("QuizAttempt", back_populates="quiz", cascade="all, delete-orphan")
 
@@ -82,6 +93,10 @@ class QuizAttempt(Base):
     time_taken = Column(Integer)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
+    __table_args__ = (
+        Index("ix_quiz_attempts_user_created_id", user_id, created_at.desc(), id.desc()),
+    )
+    
     quiz = relationship("Quiz", back_populates="attempts")
     user = relationship("User", back_populates="quiz_attempts")
 
@@ -92,7 +107,9 @@ class Note(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     title = Column(String(255), nullable=False)
-    original_text = Column(Text, nullable=False)
+    # Source text lives in the documents table; this column only holds rows not yet backfilled
+    legacy_original_text = Column("original_text", Text, nullable=False, default="")
+    document_hash = Column(String(64), ForeignKey("documents.content_hash"), index=True)
     summary_text = Column(Text, nullable=False)
     format = Column(String(50))
     key_terms = Column(JSON)
@@ -100,7 +117,38 @@ class Note(Base):
     summary_length = Column(Integer)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
+    __table_args__ = (
+        Index("ix_notes_user_created_id", user_id, created_at.desc(), id.desc()),
+    )
+    
     user = relationship("User", back_populates="notes")
+    document = relationship("Document")
+    
+    @property
+    def original_text(self) -> str:
+        """Source text, decompressed on first access"""
+        if self.document is not None:
+            return self.document.text
+        return self.legacy_original_text or ""
+
+
+class Document(Base):
+    """Compressed note source text, stored once per distinct content"""
+    __tablename__ = "documents"
+    
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 of the UTF-8 text
+    compression = Column(String(10), nullable=False)  # zlib, zstd
+    data = Column(LargeBinary, nullable=False)
+    text_length = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    @property
+    def text(self) -> str:
+        from .services.document_store import document_store
+        
+        if not hasattr(self, "_text"):
+            self._text = document_store.decompress(self.data, self.compression)
+        return self._text
 
 
 class VoiceSession(Base):
@@ -110,9 +158,72 @@ class VoiceSession(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     mode = Column(String(50))
     duration = Column(Integer)
-    messages = Column(JSON, nullable=False)
+    # Pre-voice_messages JSON history; emptied by the migration and no longer written
+    legacy_messages = Column("messages", JSON, nullable=False, default=list)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Rolling summary of turns 1..summarized_through, refreshed every few turns
+    context_summary = Column(Text)
+    summarized_through = Column(Integer, nullable=False, default=0, server_default="0")
     feedback = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     ended_at = Column(DateTime(timezone=True))
     
+    __table_args__ = (
+        Index("ix_voice_sessions_user_created_id", user_id, created_at.desc(), id.desc()),
+    )
+    
     user = relationship("User", back_populates="voice_sessions")
+    message_rows = relationship(
+        "VoiceSessionMessage",
+        back_populates="session",
+        order_by="VoiceSessionMessage.seq",
+        cascade="all, delete-orphan"
+    )
+    
+    @property
+    def messages(self):
+        """Full conversation as role/content/timestamp dicts"""
+        return [message.to_dict() for message in self.message_rows]
+
+
+class VoiceSessionMessage(Base):
+    __tablename__ = "voice_messages"
+    __table_args__ = (
+        Index("ix_voice_messages_session_seq", "session_id", "seq", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("voice_sessions.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    role = Column(String(20), nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    session = relationship("VoiceSession", back_populates="message_rows")
+    
+    def to_dict(self):
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class UserStat(Base):
+    """Per-user dashboard counters, maintained on flush by StatsService"""
+    __tablename__ = "user_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_questions = Column(Integer, nullable=False, default=0, server_default="0")
+    total_quizzes = Column(Integer, nullable=False, default=0, server_default="0")
+    total_quiz_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    total_notes = Column(Integer, nullable=False, default=0, server_default="0")
+    total_voice_sessions = Column(Integer, nullable=False, default=0, server_default="0")
+    quiz_score_sum = Column(Float, nullable=False, default=0.0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    @property
+    def average_quiz_score(self) -> float:
+        if not self.total_quiz_attempts:
+            return 0.0
+        return self.quiz_score_sum / self.total_quiz_attempts
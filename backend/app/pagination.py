@@ -0,0 +1,79 @@
+"""Keyset pagination for history endpoints.
+
+Lists are ordered newest first by (created_at, id). A page's cursor encodes
+the last row's (created_at, id), and the next page is read with a range
+condition on the (user_id, created_at DESC, id) index. Each page costs the
+same however deep it is, unlike OFFSET, which scans every skipped row.
+The cursor for the following page is returned in the X-Next-Cursor header.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from fastapi import HTTPException, Response, status
+from sqlalchemy import Select, String, and_, literal, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import IS_SQLITE
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque cursor pointing just past the given row"""
+    payload = json.dumps({"t": created_at.isoformat(), "i": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; rejects tampered or malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), int(payload["i"])
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def _timestamp_param(created_at: datetime) -> Any:
+    """Bind the cursor timestamp in the form the database stores it"""
+    if not IS_SQLITE:
+        return created_at
+    # SQLite keeps CURRENT_TIMESTAMP defaults as text without fractional
+    # seconds, while SQLAlchemy binds '.ffffff'; compare like with like
+    value = created_at.strftime("%Y-%m-%d %H:%M:%S")
+    if created_at.microsecond:
+        value += created_at.strftime(".%f")
+    return literal(value, String)
+
+
+async def paginate(
+    db: AsyncSession,
+    statement: Select,
+    model: Any,
+    response: Response,
+    limit: int,
+    skip: int = 0,
+    cursor: Optional[str] = None
+) -> List[Any]:
+    """Return one newest-first page of statement, by cursor if given, else by offset"""
+    statement = statement.order_by(model.created_at.desc(), model.id.desc())
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        created_param = _timestamp_param(created_at)
+        statement = statement.where(or_(
+            model.created_at < created_param,
+            and_(model.created_at == created_param, model.id < row_id)
+        ))
+    elif skip:
+        statement = statement.offset(skip)
+    
+    # One extra row tells whether another page exists
+    rows = (await db.execute(statement.limit(limit + 1))).scalars().all()
+    page = rows[:limit]
+    if page and len(rows) > limit and page[-1].created_at is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(page[-1].created_at, page[-1].id)
+    return page
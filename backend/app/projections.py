@@ -0,0 +1,38 @@
+"""Lightweight list projections.
+
+List endpoints load and return only small summary columns. Heavy columns
+(document text, question JSON, message histories) are deferred and sent
+only when named in ?expand=, e.g. GET /notes/?expand=summary_text,key_terms.
+Routes using this set response_model_exclude_unset so fields that were not
+requested are left out of the response rather than returned as null.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+from fastapi import HTTPException, status
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+
+
+def parse_expand(expand: Optional[str], allowed: Sequence[str]) -> List[str]:
+    """Split a comma-separated ?expand= value, rejecting unknown fields"""
+    if not expand:
+        return []
+    requested = [field.strip() for field in expand.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot expand {', '.join(unknown)}; expandable fields: {', '.join(allowed)}"
+        )
+    return list(dict.fromkeys(requested))
+
+
+def load_columns(model: Any, fields: Sequence[str]):
+    """load_only() option for the mapped columns among fields"""
+    mapped = inspect(model).column_attrs.keys()
+    columns = [getattr(model, field) for field in fields if field in mapped]
+    return load_only(*columns)
+
+
+def project(obj: Any, fields: Sequence[str]) -> Dict[str, Any]:
+    """Dict of just the given attributes, so deferred columns are never touched"""
+    return {field: getattr(obj, field) for field in fields}
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
 from ..schemas import UserCreate, UserLogin, Token
 from ..services.auth_service import AuthService
 
@@ -8,10 +8,10 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 
 @router.post("/signup", response_model=Token, status_code=status.HTTP_201_CREATED)
-def signup(user_data: UserCreate, db: Session = Depends(get_db)):
+async def signup(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     # Check if user already exists
-    existing_user = AuthService.get_user_by_email(db, user_data.email)
+    existing_user = await db.run_sync(AuthService.get_user_by_email, user_data.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -19,7 +19,7 @@ def signup(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create user
-    user = AuthService.create_user(db, user_data)
+    user = await db.run_sync(AuthService.create_user, user_data)
     
     # Generate token
     access_token = AuthService.create_access_token(data={"sub": str(user.id)})
@@ -28,9 +28,9 @@ def signup(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token)
-def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Login user"""
-    user = AuthService.authenticate_user(db, user_data.email, user_data.password)
+    user = await db.run_sync(AuthService.authenticate_user, user_data.email, user_data.password)
     
     if not user:
         raise HTTPException(
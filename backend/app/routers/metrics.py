@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends
+from ..database import database_stats
+from ..dependencies import get_current_principal
+from ..services.ai_service import ai_service
+from ..services.auth_cache import auth_cache
+from ..services.cache_service import response_cache
+from ..services.file_service import file_service
+from ..services.rate_limiter import rate_limiter
+from ..services.semantic_cache import semantic_cache
+from ..services.single_flight import single_flight
+from ..services.write_behind import write_behind
+
+# Counters reveal other users' activity and upstream state, so callers must be signed in
+router = APIRouter(prefix="/metrics", tags=["Metrics"], dependencies=[Depends(get_current_principal)])
+
+
+@router.get("/")
+def get_metrics():
+    """Get runtime performance counters"""
+    return {
+        "ai_response_cache": response_cache.stats(),
+        "semantic_question_cache": semantic_cache.stats(),
+        "ai_single_flight": single_flight.stats(),
+        "ai_prompt_packing": ai_service.packing_stats(),
+        "ai_upstream": ai_service.upstream_stats(),
+        "auth_cache": auth_cache.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "database": database_stats(),
+        "write_behind": write_behind.stats(),
+        "file_extraction": file_service.stats()
+    }
@@ -1,24 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status, UploadFile, File, Form
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional
-from ..database import get_db
-from ..schemas import NoteCreate, NoteResponse
-from ..models import User, Note
-from ..dependencies import get_current_user
+from ..database import get_async_db
+from ..schemas import NoteCreate, NoteResponse, NoteSummary, UserPrincipal
+from ..models import Note
+from ..dependencies import ai_rate_limit, get_current_principal, get_synced_principal, rate_limit
+from ..pagination import paginate
+from ..projections import load_columns, parse_expand, project
 from ..services.ai_service import ai_service
 from ..services.file_service import file_service
+from ..services.progress_service import summary_progress
+from ..services.document_store import document_store
+from ..services.write_behind import write_behind
 
+# Rate limited per route, so polling summary progress doesn't spend the bucket
 router = APIRouter(prefix="/notes", tags=["Notes"])
 
+NOTE_LIST_FIELDS = ["id", "title", "format", "original_length", "summary_length", "created_at"]
+NOTE_EXPANDABLE_FIELDS = ["summary_text", "key_terms", "original_text"]
 
-@router.post("/summarize", response_model=NoteResponse, status_code=status.HTTP_201_CREATED)
+
+@router.post("/summarize", response_model=NoteResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(ai_rate_limit)])
 async def create_summary(
     title: str = Form(...),
     format: str = Form("bullet_points"),
     text_content: Optional[str] = Form(None),
     file: Optional[UploadFile] = File(None),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    use_cache: bool = Form(True),
+    progress_id: Optional[str] = Form(None),
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create note summary from text or file"""
     try:
@@ -33,16 +46,26 @@ async def create_summary(
                 detail="Either text_content or file must be provided"
             )
         
-        # Generate summary
-        ai_response = ai_service.summarize_text(original_text, format)
+        # Generate summary; long documents are summarized chunk by chunk
+        progress = None
+        if progress_id:
+            progress = lambda stage, completed, total: summary_progress.update(
+                f"{current_user.id}:{progress_id}", stage, completed, total
+            )
+        ai_response = await ai_service.summarize_document(
+            original_text,
+            format,
+            use_cache=use_cache,
+            progress=progress
+        )
         summary_text = ai_response.get("summary", "")
         key_terms = ai_response.get("key_terms", [])
         
-        # Save to database
+        # Save to database; identical source text is stored once
         db_note = Note(
             user_id=current_user.id,
             title=title,
-            original_text=original_text,
+            document_hash=document_store.content_hash(original_text),
             summary_text=summary_text,
             format=format,
             key_terms=key_terms,
@@ -50,12 +73,22 @@ async def create_summary(
             summary_length=len(summary_text)
         )
         
-        db.add(db_note)
-        db.commit()
-        db.refresh(db_note)
+        # original_text is read through the document relationship, which can't lazy load here
+        await write_behind.save(
+            db,
+            db_note,
+            before_insert=lambda sync_db: document_store.put(sync_db.connection(), original_text),
+            relationships=["document"]
+        )
         
-        return db_note
+        response = NoteResponse.model_validate(db_note)
+        # A queued note isn't linked to its document row yet
+        response.original_text = original_text
+        return response
     
+    except HTTPException:
+        # Upload and validation errors (400, 413, 422) keep their status
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -63,34 +96,69 @@ async def create_summary(
         )
 
 
-@router.get("/", response_model=List[NoteResponse])
-def get_notes(
-    skip: int = 0,
-    limit: int = 20,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@router.get("/summarize/progress/{progress_id}", response_model=dict)
+def get_summary_progress(
+    progress_id: str,
+    current_user: UserPrincipal = Depends(get_current_principal)
 ):
-    """Get user's notes"""
-    notes = db.query(Note)\
-        .filter(Note.user_id == current_user.id)\
-        .order_by(Note.created_at.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    """Get progress of a summary started with the given progress_id"""
+    progress = summary_progress.get(f"{current_user.id}:{progress_id}")
+    
+    if not progress:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No summary in progress with this id"
+        )
+    
+    return progress
+
+
+@router.get("/", response_model=List[NoteSummary], response_model_exclude_unset=True, dependencies=[Depends(rate_limit)])
+async def get_notes(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: UserPrincipal = Depends(get_synced_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get user's notes without their text unless expanded"""
+    fields = NOTE_LIST_FIELDS + parse_expand(expand, NOTE_EXPANDABLE_FIELDS)
+    columns = fields
+    if "original_text" in fields:
+        columns = fields + ["document_hash", "legacy_original_text"]
+    statement = select(Note)\
+        .options(load_columns(Note, columns))\
+        .where(Note.user_id == current_user.id)
+    if "original_text" in fields:
+        statement = statement.options(selectinload(Note.document))
+    
+    notes = await paginate(
+        db,
+        statement,
+        Note,
+        response,
+        limit,
+        skip=skip,
+        cursor=cursor
+    )
     
-    return notes
+    return [project(note, fields) for note in notes]
 
 
-@router.get("/{note_id}", response_model=NoteResponse)
-def get_note(
+@router.get("/{note_id}", response_model=NoteResponse, dependencies=[Depends(rate_limit)])
+async def get_note(
     note_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_synced_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get specific note by ID"""
-    note = db.query(Note)\
-        .filter(Note.id == note_id, Note.user_id == current_user.id)\
-        .first()
+    note = (await db.execute(
+        select(Note)
+        .options(selectinload(Note.document))
+        .where(Note.id == note_id, Note.user_id == current_user.id)
+    )).scalars().first()
     
     if not note:
         raise HTTPException(
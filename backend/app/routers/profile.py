@@ -1,20 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from ..database import get_db
-from ..schemas import StudentCreate, StudentUpdate, StudentResponse
-from ..models import User, Student
-from ..dependencies import get_current_user
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
+from ..schemas import StudentCreate, StudentUpdate, StudentResponse, UserPrincipal
+from ..models import Student
+from ..dependencies import get_current_principal, rate_limit
 
-router = APIRouter(prefix="/profile", tags=["Profile"])
+router = APIRouter(prefix="/profile", tags=["Profile"], dependencies=[Depends(rate_limit)])
 
 
 @router.get("/", response_model=StudentResponse)
-def get_profile(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_profile(
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get current user's profile"""
-    student = db.query(Student).filter(Student.user_id == current_user.id).first()
+    student = (await db.execute(
+        select(Student).where(Student.user_id == current_user.id)
+    )).scalars().first()
     
     if not student:
         raise HTTPException(
@@ -26,13 +29,15 @@ def get_profile(
 
 
 @router.put("/", response_model=StudentResponse)
-def update_profile(
+async def update_profile(
     profile_data: StudentUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update user profile"""
-    student = db.query(Student).filter(Student.user_id == current_user.id).first()
+    student = (await db.execute(
+        select(Student).where(Student.user_id == current_user.id)
+    )).scalars().first()
     
     if not student:
         raise HTTPException(
@@ -45,20 +50,22 @@ def update_profile(
     for field, value in update_data.items():
         setattr(student, field, value)
     
-    db.commit()
-    db.refresh(student)
+    await db.commit()
+    await db.refresh(student)
     
     return student
 
 
 @router.post("/", response_model=StudentResponse, status_code=status.HTTP_201_CREATED)
-def create_profile(
+async def create_profile(
     profile_data: StudentCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create or update user profile"""
-    student = db.query(Student).filter(Student.user_id == current_user.id).first()
+    student = (await db.execute(
+        select(Student).where(Student.user_id == current_user.id)
+    )).scalars().first()
     
     if student:
         # Update existing profile
@@ -70,7 +77,7 @@ def create_profile(
         student = Student(user_id=current_user.id, **profile_data.model_dump())
         db.add(student)
     
-    db.commit()
-    db.refresh(student)
+    await db.commit()
+    await db.refresh(student)
     
     return student
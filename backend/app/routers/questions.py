@@ -1,45 +1,89 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
-from ..schemas import QuestionAsk, QuestionResponse
-from ..models import User, Question
-from ..dependencies import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional, Tuple, Union
+from datetime import datetime
+import asyncio
+import json
+from ..database import get_async_db, AsyncSessionLocal
+from ..schemas import QuestionAsk, QuestionBatchAsk, QuestionBatchResult, QuestionResponse, UserPrincipal
+from ..models import Question
+from ..dependencies import ai_rate_limit, get_current_principal, get_synced_principal, rate_limit
+from ..pagination import paginate
+from ..config import settings
 from ..services.ai_service import ai_service
+from ..services.rate_limiter import rate_limiter
+from ..services.semantic_cache import semantic_cache
+from ..services.write_behind import write_behind
 
+# Rate limited per route, so model-backed routes are charged once
 router = APIRouter(prefix="/questions", tags=["Questions"])
 
 
-@router.post("/ask", response_model=QuestionResponse, status_code=status.HTTP_201_CREATED)
-def ask_question(
+def _matched_answer(matched_question: Question) -> Dict[str, Any]:
+    """A semantic cache match in the shape of an AI answer"""
+    return {
+        "answer": matched_question.answer_text,
+        "topics": matched_question.topics or [],
+        "concepts": matched_question.concepts or [],
+        "confidence_score": matched_question.confidence_score
+    }
+
+
+def _build_question(user_id: int, question_data: QuestionAsk, ai_response: Dict[str, Any]) -> Question:
+    return Question(
+        user_id=user_id,
+        question_text=question_data.question,
+        answer_text=ai_response.get("answer", ""),
+        explanation_type=question_data.explanation_type,
+        topics=ai_response.get("topics", []),
+        concepts=ai_response.get("concepts", []),
+        confidence_score=ai_response.get("confidence_score", 0.8)
+    )
+
+
+@router.post("/ask", response_model=QuestionResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(ai_rate_limit)])
+async def ask_question(
     question_data: QuestionAsk,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Ask a question and get AI-powered answer"""
     try:
-        # Get AI response
-        ai_response = ai_service.answer_question(
-            question_data.question,
-            question_data.explanation_type
-        )
+        # Reuse the answer of a near-duplicate question when one exists
+        match = None
+        if settings.SEMANTIC_CACHE_ENABLED and question_data.use_cache:
+            match = await db.run_sync(
+                semantic_cache.find_similar,
+                question_data.question,
+                question_data.explanation_type
+            )
+        
+        if match:
+            matched_question, similarity = match
+            ai_response = _matched_answer(matched_question)
+        else:
+            # Get AI response
+            ai_response = await ai_service.answer_question(
+                question_data.question,
+                question_data.explanation_type,
+                use_cache=question_data.use_cache
+            )
         
         # Save to database
-        db_question = Question(
-            user_id=current_user.id,
-            question_text=question_data.question,
-            answer_text=ai_response.get("answer", ""),
-            explanation_type=question_data.explanation_type,
-            topics=ai_response.get("topics", []),
-            concepts=ai_response.get("concepts", []),
-            confidence_score=ai_response.get("confidence_score", 0.8)
-        )
+        db_question = _build_question(current_user.id, question_data, ai_response)
+        
+        await write_behind.save(db, db_question)
         
-        db.add(db_question)
-        db.commit()
-        db.refresh(db_question)
+        response = QuestionResponse.model_validate(db_question)
+        if match:
+            response.from_semantic_cache = True
+            response.similarity_score = round(similarity, 4)
+        elif settings.SEMANTIC_CACHE_ENABLED:
+            semantic_cache.add(db_question.id, db_question.question_text, db_question.explanation_type)
         
-        return db_question
+        return response
     
     except Exception as e:
         raise HTTPException(
@@ -48,34 +92,234 @@ def ask_question(
         )
 
 
-@router.get("/history", response_model=List[QuestionResponse])
-def get_question_history(
-    skip: int = 0,
-    limit: int = 20,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+def _sse_event(event: str, data) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/ask/stream", dependencies=[Depends(ai_rate_limit)])
+async def ask_question_stream(
+    question_data: QuestionAsk,
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ask a question and stream the answer as Server-Sent Events"""
+    user_id = current_user.id
+    
+    match = None
+    if settings.SEMANTIC_CACHE_ENABLED and question_data.use_cache:
+        match = await db.run_sync(
+            semantic_cache.find_similar,
+            question_data.question,
+            question_data.explanation_type
+        )
+        if match:
+            matched_question, similarity = match
+            matched_answer = _matched_answer(matched_question)
+    
+    async def event_stream():
+        try:
+            if match:
+                ai_response = matched_answer
+                yield _sse_event("answer", {"text": ai_response["answer"]})
+            else:
+                ai_response = None
+                async for kind, payload in ai_service.stream_answer(
+                    question_data.question,
+                    question_data.explanation_type,
+                    use_cache=question_data.use_cache
+                ):
+                    if kind == "delta":
+                        yield _sse_event("answer", {"text": payload})
+                    else:
+                        ai_response = payload
+            
+            # The request-scoped session is closed once streaming starts, so persist with a fresh one
+            async with AsyncSessionLocal() as stream_db:
+                db_question = _build_question(user_id, question_data, ai_response)
+                await write_behind.save(stream_db, db_question)
+                
+                response = QuestionResponse.model_validate(db_question)
+                if match:
+                    response.from_semantic_cache = True
+                    response.similarity_score = round(similarity, 4)
+                elif settings.SEMANTIC_CACHE_ENABLED:
+                    semantic_cache.add(db_question.id, db_question.question_text, db_question.explanation_type)
+            
+            yield _sse_event("done", response.model_dump(mode="json"))
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Error processing question: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Per item: an AI answer, or the exception raised while getting it
+BatchOutcome = Union[Dict[str, Any], Exception]
+
+
+async def _save_batch(
+    db: AsyncSession,
+    user_id: int,
+    questions: List[QuestionAsk],
+    outcomes: List[BatchOutcome],
+    matches: List[Optional[Tuple[Question, float]]]
+) -> List[QuestionBatchResult]:
+    """Insert every answered question in one transaction; results keep request order"""
+    created_at = datetime.utcnow()
+    rows = {}
+    for index, outcome in enumerate(outcomes):
+        if not isinstance(outcome, Exception):
+            rows[index] = _build_question(user_id, questions[index], outcome)
+            rows[index].created_at = created_at
+    
+    if write_behind.active:
+        for db_question in rows.values():
+            write_behind.enqueue(db_question)
+    elif rows:
+        db.add_all(rows.values())
+        await db.commit()
+    
+    results = []
+    for index, outcome in enumerate(outcomes):
+        if index not in rows:
+            results.append(QuestionBatchResult(index=index, error=f"Error processing question: {str(outcome)}"))
+            continue
+        db_question = rows[index]
+        response = QuestionResponse.model_validate(db_question)
+        if matches[index]:
+            response.from_semantic_cache = True
+            response.similarity_score = round(matches[index][1], 4)
+        elif settings.SEMANTIC_CACHE_ENABLED:
+            semantic_cache.add(db_question.id, db_question.question_text, db_question.explanation_type)
+        results.append(QuestionBatchResult(index=index, question=response))
+    return results
+
+
+@router.post("/ask/batch", response_model=List[QuestionBatchResult], status_code=status.HTTP_201_CREATED)
+async def ask_question_batch(
+    batch_data: QuestionBatchAsk,
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Answer a list of questions concurrently and save them in one transaction"""
+    questions = batch_data.questions
+    if len(questions) > settings.QUESTION_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.QUESTION_BATCH_MAX_ITEMS} questions per batch"
+        )
+    user_id = current_user.id
+    # One charge for the request, plus a model call per question
+    await rate_limiter.enforce(user_id, settings.RATE_LIMIT_COST_DEFAULT + settings.RATE_LIMIT_COST_AI * len(questions))
+    
+    # Semantic cache lookups share the session, so they run before the fan-out
+    matches = []
+    for question_data in questions:
+        match = None
+        if settings.SEMANTIC_CACHE_ENABLED and question_data.use_cache:
+            match = await db.run_sync(
+                semantic_cache.find_similar,
+                question_data.question,
+                question_data.explanation_type
+            )
+        matches.append(match)
+    
+    # Bound parallelism per batch so one study set can't take every upstream slot
+    semaphore = asyncio.Semaphore(settings.QUESTION_BATCH_MAX_PARALLEL)
+    
+    async def answer(index: int) -> Tuple[int, BatchOutcome]:
+        if matches[index]:
+            return index, _matched_answer(matches[index][0])
+        question_data = questions[index]
+        async with semaphore:
+            try:
+                return index, await ai_service.answer_question(
+                    question_data.question,
+                    question_data.explanation_type,
+                    use_cache=question_data.use_cache
+                )
+            except Exception as e:
+                return index, e
+    
+    if not batch_data.stream:
+        outcomes = [outcome for _, outcome in await asyncio.gather(*(answer(i) for i in range(len(questions))))]
+        try:
+            return await _save_batch(db, user_id, questions, outcomes, matches)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error saving questions: {str(e)}"
+            )
+    
+    # NDJSON: one line per question as its answer arrives, then the saved results in order
+    async def line_stream():
+        tasks = [asyncio.ensure_future(answer(i)) for i in range(len(questions))]
+        try:
+            outcomes: List[BatchOutcome] = [None] * len(questions)
+            for next_done in asyncio.as_completed(tasks):
+                index, outcome = await next_done
+                outcomes[index] = outcome
+                if isinstance(outcome, Exception):
+                    line = {"index": index, "error": f"Error processing question: {str(outcome)}"}
+                else:
+                    line = {"index": index, "answer": outcome}
+                yield json.dumps(line) + "\n"
+            
+            # Fresh session for the same reason as in ask_question_stream
+            async with AsyncSessionLocal() as stream_db:
+                results = await _save_batch(stream_db, user_id, questions, outcomes, matches)
+            yield json.dumps({"done": True, "results": [r.model_dump(mode="json") for r in results]}) + "\n"
+        except Exception as e:
+            yield json.dumps({"done": True, "error": f"Error saving questions: {str(e)}"}) + "\n"
+        finally:
+            # Client went away mid-batch: stop the answers still in flight
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        line_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/history", response_model=List[QuestionResponse], dependencies=[Depends(rate_limit)])
+async def get_question_history(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: UserPrincipal = Depends(get_synced_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user's question history"""
-    questions = db.query(Question)\
-        .filter(Question.user_id == current_user.id)\
-        .order_by(Question.created_at.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    questions = await paginate(
+        db,
+        select(Question).where(Question.user_id == current_user.id),
+        Question,
+        response,
+        limit,
+        skip=skip,
+        cursor=cursor
+    )
     
     return questions
 
 
-@router.get("/{question_id}", response_model=QuestionResponse)
-def get_question(
+@router.get("/{question_id}", response_model=QuestionResponse, dependencies=[Depends(rate_limit)])
+async def get_question(
     question_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_synced_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get specific question by ID"""
-    question = db.query(Question)\
-        .filter(Question.id == question_id, Question.user_id == current_user.id)\
-        .first()
+    question = (await db.execute(
+        select(Question).where(Question.id == question_id, Question.user_id == current_user.id)
+    )).scalars().first()
     
     if not question:
         raise HTTPException(
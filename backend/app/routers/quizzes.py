@@ -1,24 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from ..database import get_db
-from ..schemas import QuizGenerate, QuizResponse, QuizAttemptSubmit, QuizAttemptResponse
-from ..models import User, Quiz, QuizAttempt
-from ..dependencies import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status, UploadFile, File, Form
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from ..config import settings
+from ..database import get_async_db
+from ..schemas import (
+    QuizGenerate, QuizResponse, QuizSummary, QuizAttemptSubmit, QuizAttemptResponse,
+    QuizBulkAttemptSubmit, UserPrincipal
+)
+from ..models import Quiz, QuizAttempt
+from ..dependencies import ai_rate_limit, get_current_principal, get_synced_principal, rate_limit
+from ..pagination import paginate
+from ..projections import load_columns, parse_expand, project
 from ..services.ai_service import ai_service
 from ..services.file_service import file_service
+from ..services.grading_service import grading_service
+from ..services.write_behind import write_behind
 
+# Rate limited per route, so model-backed routes are charged once
 router = APIRouter(prefix="/quizzes", tags=["Quizzes"])
 
+QUIZ_LIST_FIELDS = ["id", "title", "topic", "difficulty", "question_count", "created_at"]
+QUIZ_EXPANDABLE_FIELDS = ["questions"]
 
-@router.post("/generate", response_model=QuizResponse, status_code=status.HTTP_201_CREATED)
+
+@router.post("/generate", response_model=QuizResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(ai_rate_limit)])
 async def generate_quiz(
     topic: Optional[str] = Form(None),
     difficulty: str = Form("medium"),
     question_count: int = Form(5),
     file: Optional[UploadFile] = File(None),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    use_cache: bool = Form(True),
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Generate a quiz from topic or uploaded file"""
     try:
@@ -36,29 +51,32 @@ async def generate_quiz(
             )
         
         # Generate quiz using AI
-        ai_response = ai_service.generate_quiz(
+        ai_response = await ai_service.generate_quiz(
             text_content,
             difficulty,
             question_count,
-            ["mcq", "true_false"]
+            ["mcq", "true_false"],
+            use_cache=use_cache
         )
         
-        # Save to database
+        # Save to database with its answer key, so grading never scans the questions
+        questions = ai_response.get("questions", [])
         db_quiz = Quiz(
             user_id=current_user.id,
             title=ai_response.get("title", quiz_topic),
             topic=quiz_topic,
             difficulty=difficulty,
-            question_count=len(ai_response.get("questions", [])),
-            questions=ai_response.get("questions", [])
+            question_count=len(questions),
+            questions=questions,
+            answer_key=grading_service.build_answer_key(questions)
         )
         
-        db.add(db_quiz)
-        db.commit()
-        db.refresh(db_quiz)
+        await write_behind.save(db, db_quiz)
         
-        return db_quiz
+        return QuizResponse.model_validate(db_quiz)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -66,34 +84,45 @@ async def generate_quiz(
         )
 
 
-@router.get("/", response_model=List[QuizResponse])
-def get_quizzes(
-    skip: int = 0,
-    limit: int = 20,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@router.get("/", response_model=List[QuizSummary], response_model_exclude_unset=True, dependencies=[Depends(rate_limit)])
+async def get_quizzes(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: UserPrincipal = Depends(get_synced_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get user's quizzes"""
-    quizzes = db.query(Quiz)\
-        .filter(Quiz.user_id == current_user.id)\
-        .order_by(Quiz.created_at.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    """Get user's quizzes without their questions unless expanded"""
+    fields = QUIZ_LIST_FIELDS + parse_expand(expand, QUIZ_EXPANDABLE_FIELDS)
+    statement = select(Quiz)\
+        .options(load_columns(Quiz, fields))\
+        .where(Quiz.user_id == current_user.id)
+    
+    quizzes = await paginate(
+        db,
+        statement,
+        Quiz,
+        response,
+        limit,
+        skip=skip,
+        cursor=cursor
+    )
     
-    return quizzes
+    return [project(quiz, fields) for quiz in quizzes]
 
 
-@router.get("/{quiz_id}", response_model=QuizResponse)
-def get_quiz(
+@router.get("/{quiz_id}", response_model=QuizResponse, dependencies=[Depends(rate_limit)])
+async def get_quiz(
     quiz_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_synced_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get specific quiz by ID"""
-    quiz = db.query(Quiz)\
-        .filter(Quiz.id == quiz_id, Quiz.user_id == current_user.id)\
-        .first()
+    quiz = (await db.execute(
+        select(Quiz).where(Quiz.id == quiz_id, Quiz.user_id == current_user.id)
+    )).scalars().first()
     
     if not quiz:
         raise HTTPException(
@@ -104,87 +133,110 @@ def get_quiz(
     return quiz
 
 
-@router.post("/attempts", response_model=QuizAttemptResponse, status_code=status.HTTP_201_CREATED)
-def submit_quiz_attempt(
-    attempt_data: QuizAttemptSubmit,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Submit quiz attempt and get results"""
-    # Verify quiz exists and belongs to user
-    quiz = db.query(Quiz)\
-        .filter(Quiz.id == attempt_data.quiz_id, Quiz.user_id == current_user.id)\
-        .first()
+async def _get_answer_key(db: AsyncSession, quiz_id: int, user_id: int) -> Dict[str, Dict[str, Any]]:
+    """Load a quiz's answer key without its questions; 404 if the user doesn't own it"""
+    row = (await db.execute(
+        select(Quiz.answer_key).where(Quiz.id == quiz_id, Quiz.user_id == user_id)
+    )).first()
     
-    if not quiz:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Quiz not found"
         )
     
-    # Grade the quiz
-    correct_count = 0
-    graded_answers = []
+    if row.answer_key is not None:
+        return row.answer_key
+    # Quiz saved before answer keys existed and not yet backfilled
+    questions = await db.scalar(select(Quiz.questions).where(Quiz.id == quiz_id))
+    return grading_service.build_answer_key(questions)
+
+
+@router.post("/attempts", response_model=QuizAttemptResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(rate_limit)])
+async def submit_quiz_attempt(
+    attempt_data: QuizAttemptSubmit,
+    current_user: UserPrincipal = Depends(get_synced_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Submit quiz attempt and get results"""
+    # Verify quiz exists and belongs to user
+    answer_key = await _get_answer_key(db, attempt_data.quiz_id, current_user.id)
     
-    for user_answer in attempt_data.answers:
-        question_id = user_answer.get("question_id")
-        user_ans = user_answer.get("answer")
-        
-        # Find correct answer
-        correct_answer = None
-        explanation = ""
-        for q in quiz.questions:
-            if q.get("id") == question_id:
-                correct_answer = q.get("correct_answer")
-                explanation = q.get("explanation", "")
-                break
-        
-        is_correct = user_ans == correct_answer
-        if is_correct:
-            correct_count += 1
-        
-        graded_answers.append({
-            "question_id": question_id,
-            "user_answer": user_ans,
-            "correct_answer": correct_answer,
-            "is_correct": is_correct,
-            "explanation": explanation
-        })
-    
-    # Calculate score
-    total_questions = len(attempt_data.answers)
-    score = (correct_count / total_questions * 100) if total_questions > 0 else 0
+    # Grade the quiz: one answer-key lookup per answer
+    graded_answers, score = grading_service.grade(answer_key, attempt_data.answers)
     
     # Save attempt
     db_attempt = QuizAttempt(
         quiz_id=attempt_data.quiz_id,
         user_id=current_user.id,
         score=score,
-        total_questions=total_questions,
+        total_questions=len(attempt_data.answers),
         answers=graded_answers,
         time_taken=attempt_data.time_taken
     )
     
     db.add(db_attempt)
-    db.commit()
-    db.refresh(db_attempt)
+    await db.commit()
+    await db.refresh(db_attempt)
     
     return db_attempt
 
 
-@router.get("/attempts/history", response_model=List[QuizAttemptResponse])
-def get_quiz_attempts(
-    skip: int = 0,
-    limit: int = 20,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@router.post("/{quiz_id}/attempts/bulk", response_model=List[QuizAttemptResponse], status_code=status.HTTP_201_CREATED, dependencies=[Depends(rate_limit)])
+async def submit_quiz_attempts_bulk(
+    quiz_id: int,
+    bulk_data: QuizBulkAttemptSubmit,
+    current_user: UserPrincipal = Depends(get_synced_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Grade many attempts at one quiz in a single request and transaction"""
+    if len(bulk_data.attempts) > settings.QUIZ_BULK_MAX_ATTEMPTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.QUIZ_BULK_MAX_ATTEMPTS} attempts per request"
+        )
+    
+    answer_key = await _get_answer_key(db, quiz_id, current_user.id)
+    
+    # created_at is set here so the response needs no reload of each row
+    created_at = datetime.utcnow()
+    db_attempts = []
+    for attempt in bulk_data.attempts:
+        graded_answers, score = grading_service.grade(answer_key, attempt.answers)
+        db_attempts.append(QuizAttempt(
+            quiz_id=quiz_id,
+            user_id=current_user.id,
+            score=score,
+            total_questions=len(attempt.answers),
+            answers=graded_answers,
+            time_taken=attempt.time_taken,
+            created_at=created_at
+        ))
+    
+    db.add_all(db_attempts)
+    await db.commit()
+    
+    return db_attempts
+
+
+@router.get("/attempts/history", response_model=List[QuizAttemptResponse], dependencies=[Depends(rate_limit)])
+async def get_quiz_attempts(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: UserPrincipal = Depends(get_synced_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get user's quiz attempt history"""
-    attempts = db.query(QuizAttempt)\
-        .filter(QuizAttempt.user_id == current_user.id)\
-        .order_by(QuizAttempt.created_at.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    attempts = await paginate(
+        db,
+        select(QuizAttempt).where(QuizAttempt.user_id == current_user.id),
+        QuizAttempt,
+        response,
+        limit,
+        skip=skip,
+        cursor=cursor
+    )
     
     return attempts
@@ -1,49 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
 from datetime import datetime
-from ..database import get_db
-from ..schemas import VoiceMessage, VoiceSessionCreate, VoiceSessionResponse
-from ..models import User, VoiceSession
-from ..dependencies import get_current_user
+from ..database import get_async_db
+from ..schemas import VoiceMessage, VoiceSessionCreate, VoiceSessionResponse, VoiceSessionSummary, UserPrincipal
+from ..models import VoiceSession
+from ..dependencies import ai_rate_limit, get_current_principal, rate_limit
+from ..pagination import paginate
+from ..projections import load_columns, parse_expand, project
 from ..services.ai_service import ai_service
+from ..services.voice_service import voice_service
+from ..services.voice_context import voice_context
 
+# Rate limited per route, so model-backed routes are charged once
 router = APIRouter(prefix="/voice", tags=["Voice"])
 
+VOICE_SESSION_LIST_FIELDS = ["id", "mode", "duration", "message_count", "created_at", "ended_at"]
+VOICE_SESSION_EXPANDABLE_FIELDS = ["feedback", "messages"]
 
-@router.post("/sessions", response_model=VoiceSessionResponse, status_code=status.HTTP_201_CREATED)
-def create_voice_session(
+
+@router.post("/sessions", response_model=VoiceSessionResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(rate_limit)])
+async def create_voice_session(
     session_data: VoiceSessionCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new voice session"""
     db_session = VoiceSession(
         user_id=current_user.id,
         mode=session_data.mode,
-        messages=[],
+        legacy_messages=[],
         feedback={}
     )
     
     db.add(db_session)
-    db.commit()
-    db.refresh(db_session)
+    await db.commit()
+    await db.refresh(db_session)
+    await db.refresh(db_session, ["message_rows"])
     
     return db_session
 
 
-@router.post("/sessions/{session_id}/message", response_model=dict)
-def send_voice_message(
+@router.post("/sessions/{session_id}/message", response_model=dict, dependencies=[Depends(ai_rate_limit)])
+async def send_voice_message(
     session_id: int,
     message_data: VoiceMessage,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks,
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Send message in voice session and get AI response"""
     # Get session
-    session = db.query(VoiceSession)\
-        .filter(VoiceSession.id == session_id, VoiceSession.user_id == current_user.id)\
-        .first()
+    session = (await db.execute(
+        select(VoiceSession).where(VoiceSession.id == session_id, VoiceSession.user_id == current_user.id)
+    )).scalars().first()
     
     if not session:
         raise HTTPException(
@@ -52,35 +64,30 @@ def send_voice_message(
         )
     
     try:
-        # Add user message to history
-        user_message = {
-            "role": "user",
-            "content": message_data.content,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        session.messages.append(user_message)
+        # Rolling summary of older turns plus the recent ones that fit the token budget
+        context_summary, history = await voice_context.build_context(db, session)
         
         # Get AI response
-        ai_response = ai_service.voice_conversation(
+        ai_response = await ai_service.voice_conversation(
             message_data.content,
             message_data.mode,
-            session.messages
+            history,
+            context_summary=context_summary
         )
         
-        # Add AI response to history
-        ai_message = {
-            "role": "assistant",
-            "content": ai_response.get("response", ""),
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        session.messages.append(ai_message)
+        # Append both turns as new rows
+        await voice_service.append_message(db, session, "user", message_data.content)
+        await voice_service.append_message(db, session, "assistant", ai_response.get("response", ""))
         
         # Update feedback
         if ai_response.get("feedback"):
             session.feedback = ai_response.get("feedback")
         
-        db.commit()
-        db.refresh(session)
+        await db.commit()
+        
+        # Re-summarize every few turns, after the response has been sent
+        if voice_context.needs_refresh(session):
+            background_tasks.add_task(voice_context.refresh_summary, session.id)
         
         return {
             "response": ai_response.get("response", ""),
@@ -94,16 +101,18 @@ def send_voice_message(
         )
 
 
-@router.put("/sessions/{session_id}/end", response_model=VoiceSessionResponse)
-def end_voice_session(
+@router.put("/sessions/{session_id}/end", response_model=VoiceSessionResponse, dependencies=[Depends(rate_limit)])
+async def end_voice_session(
     session_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """End voice session"""
-    session = db.query(VoiceSession)\
-        .filter(VoiceSession.id == session_id, VoiceSession.user_id == current_user.id)\
-        .first()
+    session = (await db.execute(
+        select(VoiceSession)
+        .options(selectinload(VoiceSession.message_rows))
+        .where(VoiceSession.id == session_id, VoiceSession.user_id == current_user.id)
+    )).scalars().first()
     
     if not session:
         raise HTTPException(
@@ -116,40 +125,55 @@ def end_voice_session(
         duration = (session.ended_at - session.created_at).total_seconds()
         session.duration = int(duration)
     
-    db.commit()
-    db.refresh(session)
+    await db.commit()
     
     return session
 
 
-@router.get("/sessions", response_model=List[VoiceSessionResponse])
-def get_voice_sessions(
-    skip: int = 0,
-    limit: int = 20,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@router.get("/sessions", response_model=List[VoiceSessionSummary], response_model_exclude_unset=True, dependencies=[Depends(rate_limit)])
+async def get_voice_sessions(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    expand: Optional[str] = None,
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get user's voice sessions"""
-    sessions = db.query(VoiceSession)\
-        .filter(VoiceSession.user_id == current_user.id)\
-        .order_by(VoiceSession.created_at.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
+    """Get user's voice sessions without their messages unless expanded"""
+    fields = VOICE_SESSION_LIST_FIELDS + parse_expand(expand, VOICE_SESSION_EXPANDABLE_FIELDS)
+    statement = select(VoiceSession)\
+        .options(load_columns(VoiceSession, fields))\
+        .where(VoiceSession.user_id == current_user.id)
+    if "messages" in fields:
+        # One IN query for every session's messages instead of one per session
+        statement = statement.options(selectinload(VoiceSession.message_rows))
+    
+    sessions = await paginate(
+        db,
+        statement,
+        VoiceSession,
+        response,
+        limit,
+        skip=skip,
+        cursor=cursor
+    )
     
-    return sessions
+    return [project(session, fields) for session in sessions]
 
 
-@router.get("/sessions/{session_id}", response_model=VoiceSessionResponse)
-def get_voice_session(
+@router.get("/sessions/{session_id}", response_model=VoiceSessionResponse, dependencies=[Depends(rate_limit)])
+async def get_voice_session(
     session_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get specific voice session"""
-    session = db.query(VoiceSession)\
-        .filter(VoiceSession.id == session_id, VoiceSession.user_id == current_user.id)\
-        .first()
+    session = (await db.execute(
+        select(VoiceSession)
+        .options(selectinload(VoiceSession.message_rows))
+        .where(VoiceSession.id == session_id, VoiceSession.user_id == current_user.id)
+    )).scalars().first()
     
     if not session:
         raise HTTPException(
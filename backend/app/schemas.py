@@ -21,6 +21,13 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     user_id: Optional[int] = None
+    expires_at: Optional[float] = None  # JWT exp as a Unix timestamp
+
+
+class UserPrincipal(BaseModel):
+    """Authenticated user without an ORM load; what most endpoints need"""
+    id: int
+    email: str
 
 
 # Student Profile Schemas
@@ -62,6 +69,7 @@ class StudentResponse(BaseModel):
 class QuestionAsk(BaseModel):
     question: str = Field(..., min_length=5)
     explanation_type: str = Field(default="simple", pattern="^(simple|exam|real_world)$")
+    use_cache: bool = True
 
 
 class QuestionResponse(BaseModel):
@@ -73,11 +81,24 @@ class QuestionResponse(BaseModel):
     concepts: Optional[List[str]]
     confidence_score: Optional[float]
     created_at: datetime
+    from_semantic_cache: bool = False
+    similarity_score: Optional[float] = None
     
     class Config:
         from_attributes = True
 
 
+class QuestionBatchAsk(BaseModel):
+    questions: List[QuestionAsk] = Field(..., min_length=1)
+    stream: bool = False
+
+
+class QuestionBatchResult(BaseModel):
+    index: int
+    question: Optional[QuestionResponse] = None
+    error: Optional[str] = None
+
+
 # Quiz Schemas
 class QuizGenerate(BaseModel):
     topic: Optional[str] = None
@@ -109,12 +130,35 @@ class QuizResponse(BaseModel):
         from_attributes = True
 
 
+class ExpandableSummary(BaseModel):
+    """List item; the fields defaulting to None are only present when requested with ?expand="""
+
+
+class QuizSummary(ExpandableSummary):
+    id: int
+    title: str
+    topic: str
+    difficulty: Optional[str]
+    question_count: Optional[int]
+    created_at: datetime
+    questions: Optional[List[Dict[str, Any]]] = None
+
+
 class QuizAttemptSubmit(BaseModel):
     quiz_id: int
     answers: List[Dict[str, Any]]
     time_taken: Optional[int] = None
 
 
+class QuizBulkAttempt(BaseModel):
+    answers: List[Dict[str, Any]]
+    time_taken: Optional[int] = None
+
+
+class QuizBulkAttemptSubmit(BaseModel):
+    attempts: List[QuizBulkAttempt] = Field(..., min_length=1)
+
+
 class QuizAttemptResponse(BaseModel):
     id: int
     quiz_id: int
@@ -150,6 +194,18 @@ class NoteResponse(BaseModel):
         from_attributes = True
 
 
+class NoteSummary(ExpandableSummary):
+    id: int
+    title: str
+    format: Optional[str]
+    original_length: Optional[int]
+    summary_length: Optional[int]
+    created_at: datetime
+    summary_text: Optional[str] = None
+    key_terms: Optional[List[str]] = None
+    original_text: Optional[str] = None
+
+
 # Voice Session Schemas
 class VoiceMessage(BaseModel):
     content: str
@@ -173,6 +229,17 @@ class VoiceSessionResponse(BaseModel):
         from_attributes = True
 
 
+class VoiceSessionSummary(ExpandableSummary):
+    id: int
+    mode: Optional[str]
+    duration: Optional[int]
+    message_count: int
+    created_at: datetime
+    ended_at: Optional[datetime]
+    feedback: Optional[Dict[str, Any]] = None
+    messages: Optional[List[Dict[str, Any]]] = None
+
+
 # Analytics Schemas
 class UserStats(BaseModel):
     total_questions: int
@@ -1,57 +1,406 @@
-from google import genai
-from google.genai import types
-import time
+import asyncio
 import json
-from typing import Dict, Any, List, Optional
+import time
+from typing import Dict, Any, Awaitable, List, Optional, Callable, AsyncIterator, Tuple, Union
 from ..config import settings
+from .cache_service import response_cache
+from .single_flight import single_flight
+from .llm_backends import LLMBackend, create_backend
+from .micro_batcher import MicroBatcher
+from .upstream_guard import (
+    AdaptiveLimiter, CircuitBreaker, RetryBudget,
+    CLIENT_ERROR, RATE_LIMITED, UNAVAILABLE, backoff_delay, classify_error
+)
+from .file_service import FileService
 
 
 class AIService:
-    def __init__(self):
-        self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
-        self.model_id = settings.GEMINI_MODEL
+    ANSWER_STYLES = {
+        "simple": "You are a friendly tutor explaining concepts in simple, easy-to-understand language suitable for beginners.",
+        "exam": "You are an exam preparation tutor. Provide structured answers with key points, formulas, and exam tips.",
+        "real_world": "You are a practical tutor connecting concepts to real-world applications and examples."
+    }
+    
+    ANSWER_FORMATTING_RULES = """IMPORTANT FORMATTING RULES:
+- Do NOT use asterisks (*) for emphasis or bullet points
+- Do NOT use markdown formatting (**, __, ##, etc.)
+- Use plain text only
+- Use numbers (1, 2, 3) for lists instead of asterisks
+- Use clear paragraph breaks for readability
+- Keep the answer professional and educational
+- Write in a natural, conversational style"""
+    
+    # Separates the streamed plain-text answer from its trailing JSON metadata
+    STREAM_METADATA_MARKER = "<<<METADATA>>>"
     
-    def _call_with_retry(self, prompt: str, system_instruction: Optional[str] = None) -> str:
-        """Call Gemini API with retry logic"""
-        for attempt in range(settings.AI_RETRY_ATTEMPTS):
+    SUMMARY_FORMATS = {
+        "bullet_points": "Provide a summary as clear bullet points highlighting key information. Use numbers (1, 2, 3) instead of asterisks.",
+        "paragraph": "Provide a summary as a cohesive paragraph.",
+        "outline": "Provide a summary as a hierarchical outline with main points and sub-points. Use numbers instead of asterisks.",
+        "key_concepts": "Extract and explain the key concepts from the text."
+    }
+    
+    def __init__(self, backend: Optional[LLMBackend] = None):
+        self.backend = backend or create_backend()
+        self.model_id = self.backend.model_id
+        # Bounds in-flight Gemini calls per worker, shrinking when Gemini pushes back
+        self.limiter = AdaptiveLimiter(
+            initial_limit=settings.AI_MAX_CONCURRENCY,
+            min_limit=settings.AI_MIN_CONCURRENCY,
+            max_limit=settings.AI_MAX_CONCURRENCY,
+            decrease_ratio=settings.AI_CONCURRENCY_DECREASE_RATIO
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.AI_BREAKER_FAILURE_THRESHOLD,
+            reset_seconds=settings.AI_BREAKER_RESET_SECONDS
+        )
+        self.retry_budget = RetryBudget(
+            ratio=settings.AI_RETRY_BUDGET_RATIO,
+            max_tokens=settings.AI_RETRY_BUDGET_MAX_TOKENS
+        )
+        self.upstream_errors = {RATE_LIMITED: 0, UNAVAILABLE: 0, CLIENT_ERROR: 0}
+        # Short questions arriving together share one packed upstream call
+        self.answer_batcher = MicroBatcher(
+            settings.AI_PACKING_WINDOW_MS,
+            settings.AI_PACKING_MAX_BATCH,
+            self._answer_packed
+        )
+        self.packing_fallbacks = 0
+    
+    async def _acquire(self, deadline: float) -> float:
+        """Pass the circuit breaker and wait for a limiter slot before the deadline"""
+        self.breaker.before_call()
+        try:
+            return await asyncio.wait_for(self.limiter.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.breaker.record_neutral()
+            raise Exception("AI service busy: no upstream slot before the deadline")
+        except asyncio.CancelledError:
+            self.breaker.record_neutral()
+            raise
+    
+    def _release(self, started_at: float, error: Optional[BaseException] = None) -> Optional[str]:
+        """Report an attempt's outcome to the limiter and breaker; returns the error kind"""
+        if error is None:
+            self.limiter.on_success()
+            self.breaker.record_success()
+            return None
+        if not isinstance(error, Exception):
+            # Cancelled or closed by the caller
+            self.limiter.on_ignore()
+            self.breaker.record_neutral()
+            return None
+        
+        kind = classify_error(error)
+        self.upstream_errors[kind] += 1
+        if kind == UNAVAILABLE:
+            self.limiter.on_dropped(started_at)
+            self.breaker.record_failure()
+        elif kind == RATE_LIMITED:
+            self.limiter.on_dropped(started_at)
+            self.breaker.record_neutral()
+        else:
+            self.limiter.on_ignore()
+            self.breaker.record_neutral()
+        return kind
+    
+    def _retry_delay(self, kind: str, attempt: int, deadline: float) -> Optional[float]:
+        """Seconds to wait before retrying, or None when the failure shouldn't be retried"""
+        if kind == CLIENT_ERROR or attempt + 1 >= settings.AI_RETRY_ATTEMPTS:
+            return None
+        # Rate limiting means slow down: back off one step further than for outages
+        step = attempt + 1 if kind == RATE_LIMITED else attempt
+        delay = backoff_delay(step, settings.AI_RETRY_DELAY, settings.AI_RETRY_MAX_DELAY)
+        if time.monotonic() + delay >= deadline or not self.retry_budget.try_spend():
+            return None
+        return delay
+    
+    async def _call_with_retry(self, prompt: str, system_instruction: Optional[str] = None) -> str:
+        """Call Gemini API through the breaker and limiter, retrying transient failures"""
+        deadline = time.monotonic() + settings.AI_CALL_DEADLINE_SECONDS
+        self.retry_budget.record_call()
+        attempt = 0
+        while True:
+            started_at = await self._acquire(deadline)
             try:
-                messages = []
-                if system_instruction:
-                    messages.append(types.Content(
-                        role="user",
-                        parts=[types.Part(text=system_instruction)]
-                    ))
-                
-                messages.append(types.Content(
-                    role="user",
-                    parts=[types.Part(text=prompt)]
-                ))
-                
-                response = self.client.models.generate_content(
-                    model=self.model_id,
-                    contents=messages,
-                    config=types.GenerateContentConfig(
-                        temperature=settings.AI_TEMPERATURE,
-                        max_output_tokens=settings.AI_MAX_TOKENS,
-                    )
+                response_text = await asyncio.wait_for(
+                    self.backend.generate(prompt, system_instruction),
+                    max(deadline - time.monotonic(), 0)
                 )
-                
-                return response.text
-            except Exception as e:
-                if attempt < settings.AI_RETRY_ATTEMPTS - 1:
-                    time.sleep(settings.AI_RETRY_DELAY * (attempt + 1))
-                else:
-                    raise Exception(f"AI service error after {settings.AI_RETRY_ATTEMPTS} attempts: {str(e)}")
+            except BaseException as e:
+                kind = self._release(started_at, e)
+                if kind is None:
+                    raise
+                delay = self._retry_delay(kind, attempt, deadline)
+                if delay is None:
+                    raise Exception(f"AI service error after {attempt + 1} attempts: {str(e)}")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._release(started_at)
+            return response_text
     
-    def answer_question(self, question: str, explanation_type: str = "simple") -> Dict[str, Any]:
-        """Generate answer to student question"""
-        system_prompts = {
-            "simple": "You are a friendly tutor explaining concepts in simple, easy-to-understand language suitable for beginners.",
-            "exam": "You are an exam preparation tutor. Provide structured answers with key points, formulas, and exam tips.",
-            "real_world": "You are a practical tutor connecting concepts to real-world applications and examples."
+    async def _stream_with_retry(self, prompt: str, system_instruction: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream Gemini output, retrying only until the first chunk arrives"""
+        deadline = time.monotonic() + settings.AI_CALL_DEADLINE_SECONDS
+        self.retry_budget.record_call()
+        attempt = 0
+        while True:
+            started = False
+            started_at = await self._acquire(deadline)
+            try:
+                async for chunk in self.backend.generate_stream(prompt, system_instruction):
+                    started = True
+                    yield chunk
+            except BaseException as e:
+                kind = self._release(started_at, e)
+                if kind is None:
+                    raise
+                if started:
+                    raise Exception(f"AI service error while streaming: {str(e)}")
+                delay = self._retry_delay(kind, attempt, deadline)
+                if delay is None:
+                    raise Exception(f"AI service error after {attempt + 1} attempts: {str(e)}")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._release(started_at)
+            return
+    
+    def upstream_stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency_limiter": self.limiter.stats(),
+            "circuit_breaker": self.breaker.stats(),
+            "retry_budget": self.retry_budget.stats(),
+            "errors": dict(self.upstream_errors),
         }
+    
+    async def _cached_call(
+        self,
+        method: str,
+        prompt: str,
+        parse: Callable[[str], Dict[str, Any]],
+        system_instruction: Optional[str] = None,
+        use_cache: bool = True,
+        cacheable: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        call: Optional[Callable[[str, Optional[str]], Awaitable[str]]] = None
+    ) -> Dict[str, Any]:
+        """Call Gemini through the response cache and single-flight group and parse the result"""
+        cache_key = response_cache.make_key(
+            method, self.model_id, settings.AI_TEMPERATURE, f"{system_instruction or ''}\n{prompt}"
+        )
+        if settings.AI_CACHE_ENABLED:
+            if use_cache:
+                cached = await response_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+            else:
+                response_cache.record_bypass()
         
-        system_instruction = system_prompts.get(explanation_type, system_prompts["simple"])
+        async def generate() -> Dict[str, Any]:
+            response_text = await (call or self._call_with_retry)(prompt, system_instruction)
+            data = parse(response_text)
+            
+            if settings.AI_CACHE_ENABLED and (cacheable is None or cacheable(data)):
+                await response_cache.set(cache_key, data)
+            return data
+        
+        if settings.AI_SINGLE_FLIGHT_ENABLED:
+            # Identical prompts already in flight share one upstream call
+            return await single_flight.run(cache_key, generate)
+        return await generate()
+    
+    @staticmethod
+    def _clean(text: str) -> str:
+        """Strip markdown emphasis the model adds despite instructions"""
+        return text.replace('**', '').replace('*', '')
+    
+    @staticmethod
+    def _extract_json(response_text: str) -> Optional[Dict[str, Any]]:
+        """Return the outermost JSON object in a response, or None"""
+        json_start = response_text.find('{')
+        json_end = response_text.rfind('}') + 1
+        if json_start != -1 and json_end > json_start:
+            return json.loads(response_text[json_start:json_end])
+        return None
+    
+    @staticmethod
+    def _parse_answer(response_text: str) -> Dict[str, Any]:
+        """Parse an answer_question response"""
+        try:
+            response_data = AIService._extract_json(response_text)
+            if response_data is not None:
+                # Clean up any remaining asterisks
+                if 'answer' in response_data:
+                    response_data['answer'] = AIService._clean(response_data['answer'])
+                return response_data
+        except json.JSONDecodeError:
+            pass
+        
+        return {
+            "answer": AIService._clean(response_text),
+            "topics": [],
+            "concepts": [],
+            "confidence_score": 0.8
+        }
+    
+    @staticmethod
+    def _parse_quiz(response_text: str, topic: str) -> Dict[str, Any]:
+        """Parse a generate_quiz response"""
+        try:
+            quiz_data = AIService._extract_json(response_text)
+            if quiz_data is None:
+                raise ValueError("No valid JSON found in response")
+            # Clean up asterisks from questions and explanations
+            if 'questions' in quiz_data:
+                for q in quiz_data['questions']:
+                    if 'question' in q:
+                        q['question'] = AIService._clean(q['question'])
+                    if 'explanation' in q:
+                        q['explanation'] = AIService._clean(q['explanation'])
+            return quiz_data
+        except (json.JSONDecodeError, ValueError):
+            return {
+                "title": f"Quiz on {topic}",
+                "questions": []
+            }
+    
+    @staticmethod
+    def _parse_summary(response_text: str) -> Dict[str, Any]:
+        """Parse a summarize_text response"""
+        try:
+            summary_data = AIService._extract_json(response_text)
+            if summary_data is not None:
+                # Clean up asterisks
+                if 'summary' in summary_data:
+                    summary_data['summary'] = AIService._clean(summary_data['summary'])
+                return summary_data
+        except json.JSONDecodeError:
+            pass
+        
+        return {
+            "summary": AIService._clean(response_text),
+            "key_terms": []
+        }
+    
+    @staticmethod
+    def _parse_conversation(response_text: str) -> Dict[str, Any]:
+        """Parse a voice_conversation response"""
+        try:
+            conversation_data = AIService._extract_json(response_text)
+            if conversation_data is not None:
+                # Clean up asterisks
+                if 'response' in conversation_data:
+                    conversation_data['response'] = AIService._clean(conversation_data['response'])
+                if 'feedback' in conversation_data and 'suggestions' in conversation_data['feedback']:
+                    conversation_data['feedback']['suggestions'] = [
+                        AIService._clean(s) for s in conversation_data['feedback']['suggestions']
+                    ]
+                return conversation_data
+        except json.JSONDecodeError:
+            pass
+        
+        return {
+            "response": AIService._clean(response_text),
+            "feedback": {}
+        }
+    
+    async def answer_question(self, question: str, explanation_type: str = "simple", use_cache: bool = True) -> Dict[str, Any]:
+        """Generate answer to student question"""
+        system_instruction, prompt = self._answer_prompt(question, explanation_type)
+        call = None
+        if settings.AI_PACKING_ENABLED and len(question) <= settings.AI_PACKING_MAX_QUESTION_CHARS:
+            # Cache and single-flight still key on the single-question prompt
+            call = lambda prompt, system_instruction: self.answer_batcher.submit(system_instruction, (question, prompt))
+        return await self._cached_call(
+            "answer_question",
+            prompt,
+            self._parse_answer,
+            system_instruction=system_instruction,
+            use_cache=use_cache,
+            call=call
+        )
+    
+    def _packed_answer_prompt(self, questions: List[str]) -> str:
+        """Build one prompt asking for a JSON array of answers to several questions"""
+        numbered = "\n".join(f"{i}. {' '.join(question.split())}" for i, question in enumerate(questions, 1))
+        return f"""Answer each of the following student questions clearly and accurately. Answer every question independently.
+
+Questions:
+{numbered}
+
+Provide your response as a JSON array with one object per question, using the question's number as its id:
+[
+    {{
+        "id": 1,
+        "answer": "detailed answer here",
+        "topics": ["topic1", "topic2"],
+        "concepts": ["concept1", "concept2"],
+        "confidence_score": 0.95
+    }}
+]
+
+{self.ANSWER_FORMATTING_RULES}"""
+    
+    @staticmethod
+    def _split_packed_answers(response_text: str, count: int) -> List[Optional[str]]:
+        """Split a packed response into per-question answer JSON; None where an answer is missing"""
+        answers: List[Optional[str]] = [None] * count
+        array_start = response_text.find('[')
+        array_end = response_text.rfind(']') + 1
+        if array_start == -1 or array_end <= array_start:
+            return answers
+        try:
+            items = json.loads(response_text[array_start:array_end])
+        except json.JSONDecodeError:
+            return answers
+        if not isinstance(items, list):
+            return answers
+        
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get("answer"), str):
+                continue
+            try:
+                index = int(item.pop("id")) - 1
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= index < count and answers[index] is None:
+                answers[index] = json.dumps(item)
+        return answers
+    
+    async def _answer_packed(self, system_instruction: str, items: List[Tuple[str, str]]) -> List[Union[str, Exception]]:
+        """Answer a batch of (question, single prompt) pairs with one upstream call"""
+        if len(items) == 1:
+            return [await self._call_with_retry(items[0][1], system_instruction)]
+        
+        response_text = await self._call_with_retry(
+            self._packed_answer_prompt([question for question, _ in items]),
+            system_instruction
+        )
+        answers: List[Union[str, Exception, None]] = self._split_packed_answers(response_text, len(items))
+        
+        # Questions the packed response didn't answer are asked on their own
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+        if missing:
+            self.packing_fallbacks += len(missing)
+            singles = await asyncio.gather(
+                *(self._call_with_retry(items[i][1], system_instruction) for i in missing),
+                return_exceptions=True
+            )
+            for i, answer in zip(missing, singles):
+                answers[i] = answer
+        return answers
+    
+    def packing_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.AI_PACKING_ENABLED,
+            **self.answer_batcher.stats(),
+            "fallbacks": self.packing_fallbacks,
+        }
+    
+    def _answer_prompt(self, question: str, explanation_type: str) -> Tuple[str, str]:
+        """Build (system_instruction, prompt) for answer_question"""
+        system_instruction = self.ANSWER_STYLES.get(explanation_type, self.ANSWER_STYLES["simple"])
         
         prompt = f"""Answer the following student question clearly and accurately.
 
@@ -65,43 +414,83 @@ Provide your response in the following JSON format:
     "confidence_score": 0.95
 }}
 
-IMPORTANT FORMATTING RULES:
-- Do NOT use asterisks (*) for emphasis or bullet points
-- Do NOT use markdown formatting (**, __, ##, etc.)
-- Use plain text only
-- Use numbers (1, 2, 3) for lists instead of asterisks
-- Use clear paragraph breaks for readability
-- Keep the answer professional and educational
-- Write in a natural, conversational style"""
+{self.ANSWER_FORMATTING_RULES}"""
+        return system_instruction, prompt
+    
+    async def stream_answer(self, question: str, explanation_type: str = "simple", use_cache: bool = True) -> AsyncIterator[Tuple[str, Any]]:
+        """Stream an answer as ("delta", text) events followed by one ("result", data) event"""
+        system_instruction, cache_prompt = self._answer_prompt(question, explanation_type)
+        # Share cache entries with answer_question, which uses the non-streaming prompt
+        cache_key = response_cache.make_key(
+            "answer_question", self.model_id, settings.AI_TEMPERATURE, f"{system_instruction}\n{cache_prompt}"
+        )
+        if settings.AI_CACHE_ENABLED:
+            if use_cache:
+                cached = await response_cache.get(cache_key)
+                if cached is not None:
+                    yield "delta", cached.get("answer", "")
+                    yield "result", cached
+                    return
+            else:
+                response_cache.record_bypass()
         
-        response_text = self._call_with_retry(prompt, system_instruction)
+        marker = self.STREAM_METADATA_MARKER
+        prompt = f"""Answer the following student question clearly and accurately.
+
+Question: {question}
+
+Write the answer as plain text first. After the answer, write a line containing only {marker} followed by JSON metadata in this format:
+{{
+    "topics": ["topic1", "topic2"],
+    "concepts": ["concept1", "concept2"],
+    "confidence_score": 0.95
+}}
+
+{self.ANSWER_FORMATTING_RULES}"""
         
-        try:
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                response_data = json.loads(response_text[json_start:json_end])
-                # Clean up any remaining asterisks
-                if 'answer' in response_data:
-                    response_data['answer'] = response_data['answer'].replace('**', '').replace('*', '')
+        answer_parts: List[str] = []
+        buffer = ""
+        metadata_text = None
+        async for chunk in self._stream_with_retry(prompt, system_instruction):
+            if metadata_text is not None:
+                metadata_text += chunk
+                continue
+            buffer += chunk
+            marker_at = buffer.find(marker)
+            if marker_at != -1:
+                emit, metadata_text = buffer[:marker_at], buffer[marker_at + len(marker):]
+                buffer = ""
             else:
-                response_data = {
-                    "answer": response_text.replace('**', '').replace('*', ''),
-                    "topics": [],
-                    "concepts": [],
-                    "confidence_score": 0.8
-                }
-        except json.JSONDecodeError:
-            response_data = {
-                "answer": response_text.replace('**', '').replace('*', ''),
-                "topics": [],
-                "concepts": [],
-                "confidence_score": 0.8
-            }
+                # Hold back a possible partial marker at the end of the buffer
+                safe = max(len(buffer) - len(marker) + 1, 0)
+                emit, buffer = buffer[:safe], buffer[safe:]
+            emit = self._clean(emit)
+            if emit:
+                answer_parts.append(emit)
+                yield "delta", emit
+        if buffer:
+            emit = self._clean(buffer)
+            answer_parts.append(emit)
+            yield "delta", emit
+        
+        metadata: Dict[str, Any] = {}
+        if metadata_text:
+            try:
+                metadata = self._extract_json(metadata_text) or {}
+            except json.JSONDecodeError:
+                metadata = {}
         
-        return response_data
+        data = {
+            "answer": "".join(answer_parts).strip(),
+            "topics": metadata.get("topics", []),
+            "concepts": metadata.get("concepts", []),
+            "confidence_score": metadata.get("confidence_score", 0.8)
+        }
+        if settings.AI_CACHE_ENABLED and data["answer"]:
+            await response_cache.set(cache_key, data)
+        yield "result", data
     
-    def generate_quiz(self, topic: str, difficulty: str, question_count: int, question_types: List[str]) -> Dict[str, Any]:
+    async def generate_quiz(self, topic: str, difficulty: str, question_count: int, question_types: List[str], use_cache: bool = True) -> Dict[str, Any]:
         """Generate quiz questions"""
         prompt = f"""Generate a quiz on the following topic: {topic}
 
@@ -133,40 +522,18 @@ IMPORTANT FORMATTING RULES:
 - Keep questions educational and appropriate for the difficulty level
 - Write in clear, simple language"""
         
-        response_text = self._call_with_retry(prompt)
-        
-        try:
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                quiz_data = json.loads(response_text[json_start:json_end])
-                # Clean up asterisks from questions and explanations
-                if 'questions' in quiz_data:
-                    for q in quiz_data['questions']:
-                        if 'question' in q:
-                            q['question'] = q['question'].replace('**', '').replace('*', '')
-                        if 'explanation' in q:
-                            q['explanation'] = q['explanation'].replace('**', '').replace('*', '')
-            else:
-                raise ValueError("No valid JSON found in response")
-        except (json.JSONDecodeError, ValueError):
-            quiz_data = {
-                "title": f"Quiz on {topic}",
-                "questions": []
-            }
-        
-        return quiz_data
+        return await self._cached_call(
+            "generate_quiz",
+            prompt,
+            lambda response_text: self._parse_quiz(response_text, topic),
+            use_cache=use_cache,
+            # Never cache the empty fallback quiz
+            cacheable=lambda quiz_data: bool(quiz_data.get("questions"))
+        )
     
-    def summarize_text(self, text: str, format_type: str = "bullet_points") -> Dict[str, Any]:
+    async def summarize_text(self, text: str, format_type: str = "bullet_points", use_cache: bool = True) -> Dict[str, Any]:
         """Summarize text in specified format"""
-        format_instructions = {
-            "bullet_points": "Provide a summary as clear bullet points highlighting key information. Use numbers (1, 2, 3) instead of asterisks.",
-            "paragraph": "Provide a summary as a cohesive paragraph.",
-            "outline": "Provide a summary as a hierarchical outline with main points and sub-points. Use numbers instead of asterisks.",
-            "key_concepts": "Extract and explain the key concepts from the text."
-        }
-        
-        instruction = format_instructions.get(format_type, format_instructions["bullet_points"])
+        instruction = self.SUMMARY_FORMATS.get(format_type, self.SUMMARY_FORMATS["bullet_points"])
         
         prompt = f"""Summarize the following text. {instruction}
 
@@ -186,30 +553,150 @@ IMPORTANT FORMATTING RULES:
 - Keep the summary concise and educational
 - Write in clear, simple language"""
         
-        response_text = self._call_with_retry(prompt)
+        return await self._cached_call(
+            "summarize_text",
+            prompt,
+            self._parse_summary,
+            use_cache=use_cache
+        )
+    
+    async def _merge_summaries(self, partial_summaries: List[str], candidate_terms: List[str], format_type: str, use_cache: bool = True) -> Dict[str, Any]:
+        """Reduce step: merge partial summaries of consecutive sections into one"""
+        instruction = self.SUMMARY_FORMATS.get(format_type, self.SUMMARY_FORMATS["bullet_points"])
+        sections = "\n\n".join(
+            f"Section {i + 1}:\n{summary}" for i, summary in enumerate(partial_summaries)
+        )
         
-        try:
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                summary_data = json.loads(response_text[json_start:json_end])
-                # Clean up asterisks
-                if 'summary' in summary_data:
-                    summary_data['summary'] = summary_data['summary'].replace('**', '').replace('*', '')
-            else:
-                summary_data = {
-                    "summary": response_text.replace('**', '').replace('*', ''),
-                    "key_terms": []
-                }
-        except json.JSONDecodeError:
-            summary_data = {
-                "summary": response_text.replace('**', '').replace('*', ''),
-                "key_terms": []
-            }
+        prompt = f"""The following are summaries of consecutive sections of one document. Combine them into a single summary of the whole document. {instruction}
+
+Remove repetition between sections and keep the overall order of ideas.
+
+{sections}
+
+Candidate key terms collected from the sections: {', '.join(candidate_terms)}
+
+Provide your response in the following JSON format:
+{{
+    "summary": "summary text here",
+    "key_terms": ["term1", "term2", "term3"]
+}}
+
+IMPORTANT FORMATTING RULES:
+- Do NOT use asterisks (*) or markdown formatting
+- Use plain text only
+- For lists, use numbers (1, 2, 3) instead of asterisks
+- Choose the most important key terms, preferring the candidates above
+- Write in clear, simple language"""
+        
+        return await self._cached_call(
+            "merge_summaries",
+            prompt,
+            self._parse_summary,
+            use_cache=use_cache
+        )
+    
+    @staticmethod
+    def _merge_key_terms(term_lists: List[List[str]], limit: int = 30) -> List[str]:
+        """Union key terms case-insensitively, most frequent first"""
+        counts: Dict[str, int] = {}
+        first_seen: Dict[str, str] = {}
+        for terms in term_lists:
+            for term in terms or []:
+                key = term.strip().lower()
+                if not key:
+                    continue
+                counts[key] = counts.get(key, 0) + 1
+                first_seen.setdefault(key, term.strip())
+        ranked = sorted(counts, key=lambda key: -counts[key])
+        return [first_seen[key] for key in ranked[:limit]]
+    
+    async def summarize_document(
+        self,
+        text: str,
+        format_type: str = "bullet_points",
+        use_cache: bool = True,
+        max_parallel: Optional[int] = None,
+        progress: Optional[Callable[[str, int, int], None]] = None
+    ) -> Dict[str, Any]:
+        """Summarize arbitrarily long text with a map-reduce pass over chunks"""
+        chunk_size = settings.SUMMARY_CHUNK_SIZE
+        chunks = FileService.chunk_text(text, chunk_size)
+        if len(chunks) == 1:
+            if progress:
+                progress("summarize", 0, 1)
+            summary_data = await self.summarize_text(text, format_type, use_cache=use_cache)
+            if progress:
+                progress("done", 1, 1)
+            return summary_data
+        
+        # Bound parallelism per document so one upload can't take every upstream slot
+        semaphore = asyncio.Semaphore(max_parallel or settings.SUMMARY_MAX_PARALLEL)
         
-        return summary_data
+        async def run_stage(stage: str, jobs: List[Callable[[], Any]]) -> List[Dict[str, Any]]:
+            completed = 0
+            if progress:
+                progress(stage, completed, len(jobs))
+            
+            async def run(job):
+                nonlocal completed
+                async with semaphore:
+                    result = await job()
+                completed += 1
+                if progress:
+                    progress(stage, completed, len(jobs))
+                return result
+            
+            return await asyncio.gather(*(run(job) for job in jobs))
+        
+        # Map: summarize each chunk independently
+        partials = await run_stage("map", [
+            lambda chunk=chunk: self.summarize_text(chunk, "paragraph", use_cache=use_cache)
+            for chunk in chunks
+        ])
+        summaries = [p.get("summary", "") for p in partials]
+        key_terms = self._merge_key_terms([p.get("key_terms", []) for p in partials])
+        
+        # Reduce: merge groups of partial summaries until one remains
+        level = 0
+        while len(summaries) > 1:
+            groups: List[List[str]] = [[]]
+            group_size = 0
+            for summary in summaries:
+                if groups[-1] and group_size + len(summary) > chunk_size:
+                    groups.append([])
+                    group_size = 0
+                groups[-1].append(summary)
+                group_size += len(summary)
+            if len(groups) == len(summaries):
+                # Partial summaries are individually too long to pair up; merge them pairwise
+                groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+            
+            level += 1
+            final = len(groups) == 1
+            # A lone summary in an intermediate level passes through without a model call
+            to_merge = [i for i, group in enumerate(groups) if final or len(group) > 1]
+            merged_results = await run_stage(f"reduce_{level}", [
+                lambda group=groups[i]: self._merge_summaries(
+                    group, key_terms, format_type if final else "paragraph", use_cache=use_cache
+                )
+                for i in to_merge
+            ])
+            merged = [{"summary": group[0]} for group in groups]
+            for i, result in zip(to_merge, merged_results):
+                merged[i] = result
+            summaries = [m.get("summary", "") for m in merged]
+            if final:
+                key_terms = merged[0].get("key_terms") or key_terms
+        
+        if progress:
+            progress("done", 1, 1)
+        return {
+            "summary": summaries[0],
+            "key_terms": key_terms,
+            "chunk_count": len(chunks)
+        }
     
-    def voice_conversation(self, message: str, mode: str, conversation_history: List[Dict[str, str]] = None) -> Dict[str, Any]:
+    async def voice_conversation(self, message: str, mode: str, conversation_history: List[Dict[str, str]] = None, context_summary: Optional[str] = None) -> Dict[str, Any]:
         """Handle voice conversation with context"""
         mode_prompts = {
             "casual": "You are a friendly conversation partner helping a student practice casual English communication. Be encouraging and natural.",
@@ -220,9 +707,11 @@ IMPORTANT FORMATTING RULES:
         system_instruction = mode_prompts.get(mode, mode_prompts["casual"])
         
         context = ""
+        if context_summary:
+            context = f"Summary of the earlier conversation:\n{context_summary}\n\n"
         if conversation_history:
-            context = "Previous conversation:\n"
-            for msg in conversation_history[-5:]:
+            context += "Previous conversation:\n"
+            for msg in conversation_history:
                 context += f"{msg['role']}: {msg['content']}\n"
             context += "\n"
         
@@ -246,32 +735,37 @@ IMPORTANT FORMATTING RULES:
 - Keep responses clear and easy to understand
 - Provide constructive, encouraging feedback"""
         
-        response_text = self._call_with_retry(prompt, system_instruction)
+        # Conversations depend on session history, so they bypass the response cache
+        response_text = await self._call_with_retry(prompt, system_instruction)
+        return self._parse_conversation(response_text)
+    
+    async def summarize_conversation(self, mode: str, previous_summary: Optional[str], messages: List[Dict[str, str]]) -> str:
+        """Fold older conversation turns into a compact rolling summary"""
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        previous = previous_summary or "(none yet)"
         
-        try:
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                conversation_data = json.loads(response_text[json_start:json_end])
-                # Clean up asterisks
-                if 'response' in conversation_data:
-                    conversation_data['response'] = conversation_data['response'].replace('**', '').replace('*', '')
-                if 'feedback' in conversation_data and 'suggestions' in conversation_data['feedback']:
-                    conversation_data['feedback']['suggestions'] = [
-                        s.replace('**', '').replace('*', '') for s in conversation_data['feedback']['suggestions']
-                    ]
-            else:
-                conversation_data = {
-                    "response": response_text.replace('**', '').replace('*', ''),
-                    "feedback": {}
-                }
-        except json.JSONDecodeError:
-            conversation_data = {
-                "response": response_text.replace('**', '').replace('*', ''),
-                "feedback": {}
-            }
+        prompt = f"""You are keeping running notes on a {mode} practice conversation with a student.
+
+Current summary of the conversation so far:
+{previous}
+
+New turns to fold into the summary:
+{transcript}
+
+Update the summary so it covers everything above. Keep the student's goals, topics discussed, questions already asked, recurring mistakes and progress. Keep it under 150 words.
+
+Provide your response in the following JSON format:
+{{
+    "summary": "updated summary here",
+    "key_terms": ["topic1", "topic2"]
+}}
+
+IMPORTANT FORMATTING RULES:
+- Do NOT use asterisks (*) or markdown formatting
+- Use plain text only"""
         
-        return conversation_data
+        response_text = await self._call_with_retry(prompt)
+        return self._parse_summary(response_text).get("summary", previous_summary or "")
 
 
 ai_service = AIService()
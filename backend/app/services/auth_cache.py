@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from sqlalchemy import event
+from ..config import settings
+from ..models import User
+from ..schemas import UserPrincipal
+
+
+class _TTLCache:
+    """Size-capped LRU whose entries expire at a per-entry deadline"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[object, Tuple[float, object]]" = OrderedDict()
+    
+    def get(self, key: object) -> Optional[object]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: object, value: object, expires_at: float) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def pop(self, key: object) -> None:
+        self._entries.pop(key, None)
+    
+    def clear(self) -> None:
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class AuthCache:
+    """Per-process cache of verified tokens and authenticated-user snapshots.
+    
+    token -> user_id skips JWT decoding and signature checks for tokens seen
+    recently (never past the token's own expiry), and user_id -> principal
+    skips the user lookup. Account updates and deletions flushed through the
+    ORM invalidate the user's snapshot; other processes see the change once
+    their snapshot's TTL runs out.
+    """
+    
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self._tokens = _TTLCache(max_entries)
+        self._users = _TTLCache(max_entries)
+        # Bumped on invalidation so a lookup that raced it can't store a stale snapshot
+        self._versions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.token_hits = 0
+        self.token_misses = 0
+        self.user_hits = 0
+        self.user_misses = 0
+        self.invalidations = 0
+    
+    def get_token(self, token: str) -> Optional[int]:
+        """user_id of a previously verified, unexpired token"""
+        with self._lock:
+            user_id = self._tokens.get(token)
+            if user_id is None:
+                self.token_misses += 1
+            else:
+                self.token_hits += 1
+            return user_id
+    
+    def put_token(self, token: str, user_id: int, token_expires_at: Optional[float]) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            self._tokens.set(token, user_id, expires_at)
+    
+    def get_user(self, user_id: int) -> Optional[UserPrincipal]:
+        with self._lock:
+            principal = self._users.get(user_id)
+            if principal is None:
+                self.user_misses += 1
+            else:
+                self.user_hits += 1
+            return principal
+    
+    def user_version(self, user_id: int) -> int:
+        """Read before loading a user; pass to put_user"""
+        with self._lock:
+            return self._versions.get(user_id, 0)
+    
+    def put_user(self, principal: UserPrincipal, version: int) -> None:
+        """Cache a snapshot unless the user was invalidated since `version` was read"""
+        with self._lock:
+            if self._versions.get(principal.id, 0) != version:
+                return
+            self._users.set(principal.id, principal, time.time() + self.ttl_seconds)
+    
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop a user's snapshot after their account changes or is deleted"""
+        with self._lock:
+            self._users.pop(user_id)
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self.invalidations += 1
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._users.clear()
+    
+    def stats(self) -> Dict[str, object]:
+        token_lookups = self.token_hits + self.token_misses
+        user_lookups = self.user_hits + self.user_misses
+        return {
+            "tokens": len(self._tokens),
+            "users": len(self._users),
+            "token_hit_ratio": round(self.token_hits / token_lookups, 4) if token_lookups else 0.0,
+            "user_hit_ratio": round(self.user_hits / user_lookups, 4) if user_lookups else 0.0,
+            "user_hits": self.user_hits,
+            "user_misses": self.user_misses,
+            "invalidations": self.invalidations,
+        }
+
+
+auth_cache = AuthCache(
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES
+)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target: User) -> None:
+    auth_cache.invalidate_user(target.id)
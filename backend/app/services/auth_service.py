@@ -42,7 +42,7 @@ class AuthService:
             if user_id_str is None:
                 return None
             user_id = int(user_id_str)
-            return TokenData(user_id=user_id)
+            return TokenData(user_id=user_id, expires_at=payload.get("exp"))
         except (JWTError, ValueError):
             return None
     
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from ..config import settings
+
+
+class ResponseCache:
+    """Exact-match cache for parsed AI responses.
+
+    Entries live in an in-memory LRU with a TTL and size cap. When a database
+    path is configured, entries are also written to an on-disk SQLite tier so
+    they survive restarts; memory misses fall through to that tier.
+    """
+    
+    def __init__(self, max_entries: int, ttl_seconds: int, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Guards the SQLite connection, so disk I/O never holds the lock the event loop takes
+        self._disk_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bypasses = 0
+    
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Collapse whitespace and case so trivially different prompts share a key"""
+        return " ".join(prompt.split()).lower()
+    
+    @staticmethod
+    def make_key(method: str, model_id: str, temperature: float, prompt: str) -> str:
+        """Build the cache key for a prompt sent through a given AIService method"""
+        raw = "\x1f".join([method, model_id, repr(float(temperature)), ResponseCache.normalize_prompt(prompt)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def _get_conn(self) -> Optional[sqlite3.Connection]:
+        """Lazily open the persistent tier"""
+        if not self.db_path:
+            return None
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.db_path))
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            # Drop anything that expired while the process was down
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            self._conn.commit()
+        return self._conn
+    
+    def _store_in_memory(self, key: str, created_at: float, value: str) -> None:
+        self._entries[key] = (created_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh copy of the cached response, or None on miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(value)
+                del self._entries[key]
+                self.expirations += 1
+        
+        if self.db_path:
+            # Disk I/O runs off the event loop
+            row = await asyncio.to_thread(self._read_from_disk, key, now)
+            if row is not None:
+                value, created_at = row
+                with self._lock:
+                    self._store_in_memory(key, created_at, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return json.loads(value)
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def _read_from_disk(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        """Fresh (value, created_at) from the persistent tier; expired rows are deleted"""
+        with self._disk_lock:
+            conn = self._get_conn()
+            row = conn.execute(
+                "SELECT value, created_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] <= self.ttl_seconds:
+                return row
+            conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            conn.commit()
+        with self._lock:
+            self.expirations += 1
+        return None
+    
+    def _write_to_disk(self, key: str, value: str, created_at: float) -> None:
+        with self._disk_lock:
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, created_at)
+            )
+            conn.commit()
+    
+    async def set(self, key: str, data: Dict[str, Any]) -> None:
+        """Store a parsed response in every configured tier"""
+        value = json.dumps(data)
+        created_at = time.time()
+        with self._lock:
+            self._store_in_memory(key, created_at, value)
+        if self.db_path:
+            await asyncio.to_thread(self._write_to_disk, key, value, created_at)
+    
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypasses += 1
+    
+    def clear(self) -> None:
+        """Drop all entries from every tier"""
+        with self._lock:
+            self._entries.clear()
+        with self._disk_lock:
+            conn = self._get_conn()
+            if conn is not None:
+                conn.execute("DELETE FROM response_cache")
+                conn.commit()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": bool(self.db_path),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "bypasses": self.bypasses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+response_cache = ResponseCache(
+    max_entries=settings.AI_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.AI_CACHE_TTL_SECONDS,
+    db_path=settings.AI_CACHE_DB_PATH or None
+)
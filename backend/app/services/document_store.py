@@ -0,0 +1,75 @@
+import hashlib
+import zlib
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from ..config import settings
+from ..models import Document
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; zlib is always available
+    zstandard = None
+
+
+class DocumentStore:
+    """Content-addressed, compressed storage for note source text.
+    
+    Documents are keyed by the SHA-256 of their text, so re-uploading the
+    same lecture PDF adds a note row pointing at the existing blob rather
+    than another copy of the text.
+    """
+    
+    def __init__(self, compression: str, level: int):
+        if compression == "zstd" and zstandard is None:
+            compression = "zlib"
+        self.compression = compression
+        self.level = level
+    
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    
+    def compress(self, text: str) -> bytes:
+        raw = text.encode("utf-8")
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(raw)
+        return zlib.compress(raw, min(self.level, 9))
+    
+    @staticmethod
+    def decompress(data: bytes, compression: str) -> str:
+        if compression == "zstd":
+            if zstandard is None:
+                raise RuntimeError("Document is zstd-compressed but the zstandard package is not installed")
+            raw = zstandard.ZstdDecompressor().decompress(data)
+        else:
+            raw = zlib.decompress(data)
+        return raw.decode("utf-8")
+    
+    def put(self, conn: Connection, text: str) -> str:
+        """Store text if it isn't already stored and return its content hash"""
+        digest = self.content_hash(text)
+        table = Document.__table__
+        exists = conn.execute(select(table.c.content_hash).where(table.c.content_hash == digest)).first()
+        if exists is None:
+            values = {
+                "content_hash": digest,
+                "compression": self.compression,
+                "data": self.compress(text),
+                "text_length": len(text)
+            }
+            # Concurrent uploads of the same document race to insert the same key
+            if conn.dialect.name == "postgresql":
+                statement = postgresql.insert(table).values(**values).on_conflict_do_nothing()
+            elif conn.dialect.name == "sqlite":
+                statement = sqlite.insert(table).values(**values).on_conflict_do_nothing()
+            else:
+                statement = insert(table).values(**values)
+            conn.execute(statement)
+        return digest
+
+
+document_store = DocumentStore(
+    compression=settings.DOCUMENT_COMPRESSION,
+    level=settings.DOCUMENT_COMPRESSION_LEVEL
+)
@@ -1,12 +1,152 @@
+import asyncio
+import codecs
+import hashlib
+import io
+import multiprocessing
 import os
-from typing import Optional
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, BinaryIO, Dict, List, Optional, Union
 from fastapi import UploadFile, HTTPException
-import PyPDF2
-from docx import Document
 from ..config import settings
+from .text_cache import ExtractedTextCache, text_cache
+from .text_extraction import EXTRACTORS
+
+
+class StageTimings:
+    """Count, mean and max duration per extraction stage"""
+    
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, float]] = {}
+    
+    def record(self, stage: str, seconds: float) -> None:
+        entry = self._stages.setdefault(stage, {"count": 0, "total": 0.0, "max": 0.0})
+        entry["count"] += 1
+        entry["total"] += seconds
+        entry["max"] = max(entry["max"], seconds)
+    
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {
+                "count": int(entry["count"]),
+                "avg_ms": round(entry["total"] / entry["count"] * 1000, 2),
+                "max_ms": round(entry["max"] * 1000, 2),
+            }
+            for stage, entry in self._stages.items()
+        }
+
+
+class UploadSpool:
+    """Upload bytes kept in memory up to a threshold, then spilled to a named temp file.
+    
+    Works like SpooledTemporaryFile, except the spilled file has a path that
+    extraction workers can open and mmap themselves instead of receiving a
+    pickled copy of the bytes.
+    """
+    
+    def __init__(self, threshold: int, suffix: str = ""):
+        self.threshold = threshold
+        self.suffix = suffix
+        self.size = 0
+        self._buffer = bytearray()
+        self._file = None
+        self._digest = hashlib.sha256()
+    
+    @property
+    def rolled(self) -> bool:
+        return self._file is not None
+    
+    @property
+    def sha256(self) -> str:
+        """Hex digest of everything written so far"""
+        return self._digest.hexdigest()
+    
+    def write(self, chunk: bytes) -> None:
+        if self._file is None and len(self._buffer) + len(chunk) > self.threshold:
+            self._file = tempfile.NamedTemporaryFile(
+                suffix=self.suffix,
+                dir=settings.UPLOAD_TMP_DIR or None,
+                delete=False
+            )
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+        if self._file is None:
+            self._buffer += chunk
+        else:
+            self._file.write(chunk)
+        self._digest.update(chunk)
+        self.size += len(chunk)
+    
+    def source(self) -> Union[bytes, str]:
+        """The bytes while in memory, otherwise the temp file path"""
+        if self._file is None:
+            return bytes(self._buffer)
+        self._file.flush()
+        return self._file.name
+    
+    def open(self) -> BinaryIO:
+        """A readable file object positioned at the start"""
+        if self._file is None:
+            return io.BytesIO(self._buffer)
+        self._file.flush()
+        self._file.seek(0)
+        return self._file
+    
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.unlink(self._file.name)
+            except FileNotFoundError:
+                pass
+            self._file = None
+        self._buffer = bytearray()
+    
+    def __enter__(self) -> "UploadSpool":
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
 
 class FileService:
+    """Uploaded file handling; PDF and DOCX parsing runs in a process pool off the event loop"""
+    
+    def __init__(
+        self,
+        workers: int,
+        timeout_seconds: float,
+        max_pages: int,
+        max_chars: int,
+        max_upload_size: int,
+        chunk_size: int,
+        spool_threshold: int,
+        text_cache: Optional[ExtractedTextCache] = None
+    ):
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+        self.max_pages = max_pages
+        self.max_chars = max_chars
+        self.max_upload_size = max_upload_size
+        self.chunk_size = chunk_size
+        self.spool_threshold = spool_threshold
+        self.text_cache = text_cache
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Callers still waiting on each pool, and the workers of replaced pools not yet stopped
+        self._waiting: Dict[ProcessPoolExecutor, int] = {}
+        self._retiring: Dict[ProcessPoolExecutor, List[multiprocessing.Process]] = {}
+        self.timings = StageTimings()
+        self.files = 0
+        self.pages = 0
+        self.chars = 0
+        self.truncated = 0
+        self.timeouts = 0
+        self.pool_restarts = 0
+        self.spooled_to_disk = 0
+        self.rejected_too_large = 0
+    
     @staticmethod
     def validate_file(file: UploadFile) -> None:
         """Validate uploaded file"""
@@ -18,57 +158,206 @@ class FileService:
                 detail=f"File type not allowed. Allowed types: {', '.join(settings.allowed_extensions_list)}"
             )
     
-    @staticmethod
-    async def extract_text_from_file(file: UploadFile) -> str:
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned rather than forked: the parent runs an event loop and driver threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+    
+    def _retire_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Send new work to a fresh pool; pool's workers stop once no caller is waiting on it.
+
+        Killing one worker marks the whole pool broken, so a timed-out page
+        can't be stopped on its own. Extractions already running on the old
+        pool finish there instead of being restarted.
+        """
+        if self._pool is pool:
+            self._pool = None
+            self.pool_restarts += 1
+        if pool not in self._retiring:
+            # shutdown() forgets the processes, so keep them for _reap
+            self._retiring[pool] = list((pool._processes or {}).values())
+            # Jobs no worker has picked up are cancelled; their callers resubmit them
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._reap(pool)
+    
+    def _reap(self, pool: ProcessPoolExecutor) -> None:
+        if pool not in self._retiring or self._waiting.get(pool):
+            return
+        self._waiting.pop(pool, None)
+        # Anything still running was abandoned by its caller, like a page that never returns
+        for process in self._retiring.pop(pool):
+            process.terminate()
+    
+    def shutdown(self) -> None:
+        """Stop the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        for processes in self._retiring.values():
+            for process in processes:
+                process.terminate()
+        self._retiring.clear()
+        self._waiting.clear()
+    
+    async def extract_text_from_file(self, file: UploadFile) -> str:
         """Extract text from uploaded file"""
         FileService.validate_file(file)
         
         file_ext = os.path.splitext(file.filename)[1].lower()
-        content = await file.read()
+        if file_ext not in EXTRACTORS and file_ext != '.txt':
+            raise HTTPException(status_code=400, detail="Unsupported file type")
         
+        started = time.perf_counter()
+        with await self._spool_upload(file, file_ext) as spool:
+            self.timings.record("read", time.perf_counter() - started)
+            try:
+                if file_ext in EXTRACTORS:
+                    text = await self._extract_cached(file_ext, spool)
+                else:
+                    text = self._decode_text(spool.open())
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Error extracting text: {str(e)}")
+        
+        if not text.strip():
+            raise HTTPException(status_code=400, detail=f"No text found in {file_ext[1:].upper()}")
+        
+        self.files += 1
+        self.chars += len(text)
+        self.timings.record("total", time.perf_counter() - started)
+        return text
+    
+    async def _spool_upload(self, file: UploadFile, suffix: str) -> UploadSpool:
+        """Copy the upload chunk by chunk, rejecting it as soon as it passes MAX_UPLOAD_SIZE"""
+        spool = UploadSpool(self.spool_threshold, suffix)
         try:
-            if file_ext == '.pdf':
-                return FileService._extract_from_pdf(content)
-            elif file_ext == '.docx':
-                return FileService._extract_from_docx(content)
-            elif file_ext == '.txt':
-                return content.decode('utf-8')
-            else:
-                raise HTTPException(status_code=400, detail="Unsupported file type")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error extracting text: {str(e)}")
+            while True:
+                chunk = await file.read(self.chunk_size)
+                if not chunk:
+                    break
+                if spool.size + len(chunk) > self.max_upload_size:
+                    self.rejected_too_large += 1
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File is larger than the {self.max_upload_size // (1024 * 1024)}MB upload limit"
+                    )
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+        
+        if spool.rolled:
+            self.spooled_to_disk += 1
+        return spool
     
-    @staticmethod
-    def _extract_from_pdf(content: bytes) -> str:
-        """Extract text from PDF"""
-        import io
-        pdf_file = io.BytesIO(content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
+    def _decode_text(self, stream: BinaryIO) -> str:
+        """Decode UTF-8 chunk by chunk, stopping at the character cap"""
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        parts = []
+        chars = 0
+        while chars < self.max_chars:
+            chunk = stream.read(self.chunk_size)
+            if not chunk:
+                parts.append(decoder.decode(b"", final=True))
+                break
+            piece = decoder.decode(chunk)
+            parts.append(piece)
+            chars += len(piece)
         
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
+        text = "".join(parts)
+        if chars >= self.max_chars:
+            text = text[:self.max_chars]
+            self.truncated += 1
+        return text
+    
+    async def _extract_cached(self, file_ext: str, spool: UploadSpool) -> str:
+        """Reuse the text extracted from an identical earlier upload, else parse and store it"""
+        if self.text_cache is None:
+            return await self._extract_in_worker(file_ext, spool.source())
         
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="No text found in PDF")
+        key = self.text_cache.make_key(spool.sha256, file_ext, self.max_pages, self.max_chars)
+        started = time.perf_counter()
+        text = await asyncio.to_thread(self.text_cache.get, key, spool.size)
+        self.timings.record("cache_lookup", time.perf_counter() - started)
+        if text is not None:
+            return text
         
-        return text.strip()
+        text = await self._extract_in_worker(file_ext, spool.source())
+        if text.strip():
+            await asyncio.to_thread(self.text_cache.put, key, text)
+        return text
     
-    @staticmethod
-    def _extract_from_docx(content: bytes) -> str:
-        """Extract text from DOCX"""
-        import io
-        docx_file = io.BytesIO(content)
-        doc = Document(docx_file)
+    async def _extract_in_worker(self, file_ext: str, source: Union[bytes, str]) -> str:
+        """Parse in the process pool, bounded by the per-file timeout"""
+        submitted = time.time()
+        # The deadline covers queueing too; workers stop between pages once it passes
+        deadline = submitted + self.timeout_seconds
+        result = await self._run_in_pool(file_ext, source, deadline)
         
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
+        if result["timed_out"]:
+            self.timeouts += 1
+            raise HTTPException(
+                status_code=422,
+                detail=f"Text extraction took longer than {self.timeout_seconds:g} seconds"
+            )
         
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="No text found in DOCX")
+        self.timings.record("queue", max(result["started_at"] - submitted, 0.0))
+        self.timings.record("parse", result["parse_seconds"])
+        self.pages += result["units"] if file_ext == ".pdf" else 0
+        if result["truncated"]:
+            self.truncated += 1
+        return result["text"]
+    
+    async def _run_in_pool(self, file_ext: str, source: Union[bytes, str], deadline: float) -> Dict[str, Any]:
+        """Submit one extraction, moving to a new pool and retrying once if the old one broke or was retired"""
+        for _ in range(2):
+            pool = self._get_pool()
+            self._waiting[pool] = self._waiting.get(pool, 0) + 1
+            try:
+                job = pool.submit(
+                    EXTRACTORS[file_ext],
+                    source,
+                    self.max_pages,
+                    self.max_chars,
+                    deadline
+                )
+                # A single page that never returns can't be interrupted; stop waiting for it shortly after the deadline
+                return await asyncio.wait_for(asyncio.wrap_future(job), timeout=max(deadline - time.time(), 0) + 1)
+            except asyncio.TimeoutError:
+                # Don't leave the worker busy on the abandoned page
+                self._retire_pool(pool)
+                return {"timed_out": True}
+            except BrokenProcessPool:
+                self._retire_pool(pool)
+            except asyncio.CancelledError:
+                # Retrying is only right when the pool was retired before a worker took the job
+                if not job.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            finally:
+                self._waiting[pool] -= 1
+                self._reap(pool)
         
-        return text.strip()
+        raise HTTPException(status_code=503, detail="Text extraction is temporarily unavailable, please retry")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "files": self.files,
+            "pdf_pages": self.pages,
+            "chars": self.chars,
+            "truncated": self.truncated,
+            "timeouts": self.timeouts,
+            "pool_restarts": self.pool_restarts,
+            "spooled_to_disk": self.spooled_to_disk,
+            "rejected_too_large": self.rejected_too_large,
+            "stages": self.timings.stats(),
+            "text_cache": self.text_cache.stats() if self.text_cache else None,
+        }
     
     @staticmethod
     def chunk_text(text: str, max_chunk_size: int = 4000) -> list[str]:
@@ -97,4 +386,13 @@ class FileService:
         return chunks
 
 
-file_service = FileService()
+file_service = FileService(
+    workers=settings.EXTRACTION_WORKERS,
+    timeout_seconds=settings.EXTRACTION_TIMEOUT_SECONDS,
+    max_pages=settings.EXTRACTION_MAX_PAGES,
+    max_chars=settings.EXTRACTION_MAX_CHARS,
+    max_upload_size=settings.MAX_UPLOAD_SIZE,
+    chunk_size=settings.UPLOAD_CHUNK_SIZE,
+    spool_threshold=settings.UPLOAD_SPOOL_THRESHOLD,
+    text_cache=text_cache if settings.TEXT_CACHE_ENABLED else None
+)
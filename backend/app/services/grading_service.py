@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class GradingService:
+    """Quiz grading against a precomputed answer key.
+
+    The key maps str(question_id) to the normalized correct answer, the
+    answer as written and its explanation. It is built once when the quiz is
+    created, so grading an attempt is one dict lookup per answer.
+    """
+    
+    @staticmethod
+    def normalize_answer(answer: Any) -> str:
+        """Comparison form of an answer: case- and whitespace-insensitive"""
+        if answer is None:
+            return ""
+        if isinstance(answer, bool):
+            return "true" if answer else "false"
+        return " ".join(str(answer).split()).casefold()
+    
+    def build_answer_key(self, questions: Optional[List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        """Index a quiz's questions by id"""
+        answer_key = {}
+        for question in questions or []:
+            if question.get("id") is None:
+                continue
+            answer_key[str(question["id"])] = {
+                "answer": self.normalize_answer(question.get("correct_answer")),
+                "correct_answer": question.get("correct_answer"),
+                "explanation": question.get("explanation", "")
+            }
+        return answer_key
+    
+    def grade(self, answer_key: Dict[str, Dict[str, Any]], answers: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], float]:
+        """Return (graded answers, score out of 100) for one attempt"""
+        correct_count = 0
+        graded_answers = []
+        
+        for user_answer in answers:
+            question_id = user_answer.get("question_id")
+            user_ans = user_answer.get("answer")
+            entry = answer_key.get(str(question_id))
+            
+            is_correct = entry is not None and self.normalize_answer(user_ans) == entry["answer"]
+            if is_correct:
+                correct_count += 1
+            
+            graded_answers.append({
+                "question_id": question_id,
+                "user_answer": user_ans,
+                "correct_answer": entry["correct_answer"] if entry else None,
+                "is_correct": is_correct,
+                "explanation": entry["explanation"] if entry else ""
+            })
+        
+        total_questions = len(answers)
+        score = (correct_count / total_questions * 100) if total_questions > 0 else 0
+        return graded_answers, score
+
+
+grading_service = GradingService()
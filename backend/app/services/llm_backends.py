@@ -0,0 +1,234 @@
+from google import genai
+from google.genai import types
+import asyncio
+import json
+import math
+import random
+import re
+from typing import AsyncIterator, List, Optional
+from ..config import settings
+
+
+class LLMBackendError(Exception):
+    """Upstream failure carrying an HTTP-style status code"""
+    
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class LLMBackend:
+    """Interface between AIService and a text generation provider"""
+    
+    model_id: str = ""
+    
+    async def generate(self, prompt: str, system_instruction: Optional[str] = None) -> str:
+        """Return the full response text for a prompt"""
+        raise NotImplementedError
+    
+    async def generate_stream(self, prompt: str, system_instruction: Optional[str] = None) -> AsyncIterator[str]:
+        """Yield response text chunks as they are generated"""
+        raise NotImplementedError
+        yield
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through the google-genai async client"""
+    
+    def __init__(self):
+        self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        self.model_id = settings.GEMINI_MODEL
+    
+    @staticmethod
+    def _build_contents(prompt: str, system_instruction: Optional[str] = None) -> List[types.Content]:
+        messages = []
+        if system_instruction:
+            messages.append(types.Content(
+                role="user",
+                parts=[types.Part(text=system_instruction)]
+            ))
+        
+        messages.append(types.Content(
+            role="user",
+            parts=[types.Part(text=prompt)]
+        ))
+        return messages
+    
+    @staticmethod
+    def _generation_config() -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            temperature=settings.AI_TEMPERATURE,
+            max_output_tokens=settings.AI_MAX_TOKENS,
+        )
+    
+    async def generate(self, prompt: str, system_instruction: Optional[str] = None) -> str:
+        response = await self.client.aio.models.generate_content(
+            model=self.model_id,
+            contents=self._build_contents(prompt, system_instruction),
+            config=self._generation_config()
+        )
+        return response.text
+    
+    async def generate_stream(self, prompt: str, system_instruction: Optional[str] = None) -> AsyncIterator[str]:
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.model_id,
+            contents=self._build_contents(prompt, system_instruction),
+            config=self._generation_config()
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeLLMBackend(LLMBackend):
+    """Offline stand-in for Gemini used for load tests and local development.
+
+    Responses are schema-valid JSON for every AIService prompt type. Latency
+    is drawn from a configurable distribution and a configurable share of
+    calls fail with 429 or 503 errors.
+    """
+    
+    model_id = "fake-llm"
+    
+    def __init__(
+        self,
+        latency_distribution: str = "lognormal",
+        latency_mean_ms: float = 800.0,
+        latency_stddev_ms: float = 300.0,
+        error_rate: float = 0.0,
+        rate_limit_share: float = 0.5,
+        seed: Optional[int] = None
+    ):
+        self.latency_distribution = latency_distribution
+        self.latency_mean_ms = latency_mean_ms
+        self.latency_stddev_ms = latency_stddev_ms
+        self.error_rate = error_rate
+        self.rate_limit_share = rate_limit_share
+        self.random = random.Random(seed)
+    
+    def sample_latency(self) -> float:
+        """Draw one call latency in seconds"""
+        mean, stddev = self.latency_mean_ms, self.latency_stddev_ms
+        if self.latency_distribution == "constant" or mean <= 0:
+            latency_ms = mean
+        elif self.latency_distribution == "uniform":
+            latency_ms = self.random.uniform(max(mean - stddev, 0), mean + stddev)
+        elif self.latency_distribution == "exponential":
+            latency_ms = self.random.expovariate(1.0 / mean)
+        elif self.latency_distribution == "normal":
+            latency_ms = self.random.gauss(mean, stddev)
+        else:
+            # Lognormal with the requested mean and standard deviation: long right tail like real LLM calls
+            variance = (stddev / mean) ** 2
+            sigma = math.sqrt(math.log(1 + variance))
+            mu = math.log(mean) - sigma ** 2 / 2
+            latency_ms = self.random.lognormvariate(mu, sigma)
+        return max(latency_ms, 0.0) / 1000.0
+    
+    def _maybe_fail(self) -> None:
+        if self.error_rate and self.random.random() < self.error_rate:
+            if self.random.random() < self.rate_limit_share:
+                raise LLMBackendError(429, "RESOURCE_EXHAUSTED (fake)")
+            raise LLMBackendError(503, "UNAVAILABLE (fake)")
+    
+    @staticmethod
+    def _find(pattern: str, prompt: str, default: str = "") -> str:
+        match = re.search(pattern, prompt)
+        return match.group(1).strip() if match else default
+    
+    def _respond(self, prompt: str) -> str:
+        """Build a response matching the JSON shape the prompt asks for"""
+        if "JSON array" in prompt:
+            # Packed prompt: one answer object per numbered question
+            questions = re.findall(r"^(\d+)\. (.*)$", prompt.split("Provide your response")[0], re.MULTILINE)
+            return json.dumps([
+                {
+                    "id": int(number),
+                    "answer": (f"Here is an explanation of {question.strip()} " + "It builds on a few key ideas. " * 8).strip(),
+                    "topics": ["General"],
+                    "concepts": ["Fundamentals"],
+                    "confidence_score": 0.9
+                }
+                for number, question in questions
+            ])
+        
+        if '"questions": [' in prompt:
+            topic = self._find(r"topic: (.*)", prompt, "the topic")[:60]
+            count = int(self._find(r"Number of questions: (\d+)", prompt, "5"))
+            questions = []
+            for i in range(1, count + 1):
+                if i % 2:
+                    options = [f"Option {letter}" for letter in "ABCD"]
+                    questions.append({
+                        "id": i,
+                        "type": "mcq",
+                        "question": f"Question {i} about {topic}?",
+                        "options": options,
+                        "correct_answer": self.random.choice(options),
+                        "explanation": f"Explanation for question {i}."
+                    })
+                else:
+                    questions.append({
+                        "id": i,
+                        "type": "true_false",
+                        "question": f"Statement {i} about {topic} is true.",
+                        "options": ["True", "False"],
+                        "correct_answer": self.random.choice(["True", "False"]),
+                        "explanation": f"Explanation for statement {i}."
+                    })
+            return json.dumps({"title": f"Quiz on {topic}", "questions": questions})
+        
+        if '"summary"' in prompt:
+            words = re.findall(r"[A-Za-z]{6,}", prompt.split("Provide your response")[0])
+            key_terms = list(dict.fromkeys(w.lower() for w in words))[:5]
+            return json.dumps({
+                "summary": "1. " + " ".join(words[:40]) + ".",
+                "key_terms": key_terms
+            })
+        
+        if '"response"' in prompt:
+            return json.dumps({
+                "response": "That is a good point. Can you tell me more about it?",
+                "feedback": {
+                    "fluency_score": round(self.random.uniform(6, 9.5), 1),
+                    "suggestions": ["Use more specific examples", "Slow down slightly"]
+                }
+            })
+        
+        question = self._find(r"Question: (.*)", prompt, "your question")
+        answer = f"Here is an explanation of {question} " + "It builds on a few key ideas. " * 8
+        metadata = {"topics": ["General"], "concepts": ["Fundamentals"], "confidence_score": 0.9}
+        marker = self._find(r"line containing only (\S+)", prompt)
+        if marker:
+            return f"{answer.strip()}\n{marker}\n{json.dumps(metadata)}"
+        return json.dumps({"answer": answer.strip(), **metadata})
+    
+    async def generate(self, prompt: str, system_instruction: Optional[str] = None) -> str:
+        await asyncio.sleep(self.sample_latency())
+        self._maybe_fail()
+        return self._respond(prompt)
+    
+    async def generate_stream(self, prompt: str, system_instruction: Optional[str] = None) -> AsyncIterator[str]:
+        latency = self.sample_latency()
+        # Spend a fifth of the latency before the first chunk, the rest spread over the stream
+        await asyncio.sleep(latency * 0.2)
+        self._maybe_fail()
+        text = self._respond(prompt)
+        chunks = [text[i:i + 40] for i in range(0, len(text), 40)]
+        for chunk in chunks:
+            await asyncio.sleep(latency * 0.8 / len(chunks))
+            yield chunk
+
+
+def create_backend() -> LLMBackend:
+    """Instantiate the backend selected by settings.AI_BACKEND"""
+    if settings.AI_BACKEND == "fake":
+        return FakeLLMBackend(
+            latency_distribution=settings.FAKE_LLM_LATENCY_DISTRIBUTION,
+            latency_mean_ms=settings.FAKE_LLM_LATENCY_MEAN_MS,
+            latency_stddev_ms=settings.FAKE_LLM_LATENCY_STDDEV_MS,
+            error_rate=settings.FAKE_LLM_ERROR_RATE,
+            rate_limit_share=settings.FAKE_LLM_RATE_LIMIT_SHARE,
+            seed=settings.FAKE_LLM_SEED
+        )
+    return GeminiBackend()
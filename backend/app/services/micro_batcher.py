@@ -0,0 +1,88 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set
+
+
+# Called with a group and its items; returns one result per item, in order.
+# An Exception in the list fails only that item's caller
+BatchFunction = Callable[[Hashable, List[Any]], Awaitable[List[Any]]]
+
+
+class _OpenBatch:
+    __slots__ = ("items", "futures", "timer")
+    
+    def __init__(self):
+        self.items: List[Any] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer = None
+
+
+class MicroBatcher:
+    """Collect concurrent requests over a short window and run them as one batch.
+
+    The first request for a group opens a window of window_ms; requests for
+    the same group that arrive before it closes join the batch. Reaching
+    max_batch_size closes the window early. The batch runs as its own task,
+    so a caller disconnecting doesn't cancel the call for the others.
+    """
+    
+    def __init__(self, window_ms: float, max_batch_size: int, run_batch: BatchFunction):
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.run_batch = run_batch
+        self._open: Dict[Hashable, _OpenBatch] = {}
+        self._running: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+    
+    async def submit(self, group: Hashable, item: Any) -> Any:
+        """Add item to the group's open batch and wait for its result"""
+        loop = asyncio.get_running_loop()
+        batch = self._open.get(group)
+        if batch is None:
+            batch = _OpenBatch()
+            batch.timer = loop.call_later(self.window, self._dispatch, group, batch)
+            self._open[group] = batch
+        
+        future = loop.create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        if len(batch.items) >= self.max_batch_size:
+            batch.timer.cancel()
+            self._dispatch(group, batch)
+        return await future
+    
+    def _dispatch(self, group: Hashable, batch: _OpenBatch) -> None:
+        if self._open.get(group) is batch:
+            del self._open[group]
+        self.batches += 1
+        self.items += len(batch.items)
+        self.largest_batch = max(self.largest_batch, len(batch.items))
+        task = asyncio.ensure_future(self._run(group, batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+    
+    async def _run(self, group: Hashable, batch: _OpenBatch) -> None:
+        try:
+            results = await self.run_batch(group, batch.items)
+        except Exception as e:
+            results = [e] * len(batch.items)
+        
+        for future, result in zip(batch.futures, results):
+            if future.done():
+                # The caller went away
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "items": self.items,
+            "largest_batch": self.largest_batch,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,31 @@
+import time
+from typing import Any, Dict, Optional
+
+
+class ProgressTracker:
+    """In-memory progress of long-running jobs, keyed by a client-supplied id"""
+    
+    def __init__(self, ttl_seconds: int = 3600):
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+    
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        for job_id in [j for j, state in self._jobs.items() if state["updated_at"] < cutoff]:
+            del self._jobs[job_id]
+    
+    def update(self, job_id: str, stage: str, completed: int, total: int) -> None:
+        """Record the current stage and how many of its steps are done"""
+        self._prune()
+        self._jobs[job_id] = {
+            "stage": stage,
+            "completed": completed,
+            "total": total,
+            "updated_at": time.time()
+        }
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._jobs.get(job_id)
+
+
+summary_progress = ProgressTracker()
@@ -0,0 +1,187 @@
+"""Per-user token-bucket rate limiting.
+
+Each user has one bucket that holds up to capacity tokens and refills at
+refill_per_second. A request spends its cost from the bucket; when there
+aren't enough tokens it is refused with the time until there will be.
+Buckets live in process memory, or in a SQLite file so every worker on the
+host draws from the same bucket.
+"""
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException
+from ..config import settings
+
+
+class RateLimitExceeded(HTTPException):
+    def __init__(self, retry_after: float):
+        seconds = max(math.ceil(retry_after), 1)
+        super().__init__(
+            status_code=429,
+            detail=f"Rate limit exceeded, retry in {seconds}s",
+            headers={"Retry-After": str(seconds)}
+        )
+
+
+def _take(
+    tokens: float,
+    updated_at: float,
+    now: float,
+    cost: float,
+    capacity: float,
+    refill_per_second: float
+) -> Tuple[float, float]:
+    """Refill a bucket up to now and spend cost; returns (tokens left, seconds to wait or 0)"""
+    tokens = min(capacity, tokens + max(now - updated_at, 0) * refill_per_second)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / refill_per_second
+
+
+class MemoryBucketStore:
+    """Buckets in a dict, private to this process"""
+    
+    blocking = False
+    
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+    
+    def take(self, key: str, cost: float, capacity: float, refill_per_second: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens, retry_after = _take(tokens, updated_at, now, cost, capacity, refill_per_second)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_entries:
+                self._prune(now, capacity, refill_per_second)
+            return retry_after
+    
+    def _prune(self, now: float, capacity: float, refill_per_second: float) -> None:
+        # A bucket that has refilled completely is the same as no bucket
+        full_after = capacity / refill_per_second
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket[1] < full_after
+        }
+
+
+class SQLiteBucketStore:
+    """Buckets in a SQLite file shared by every worker process on the host"""
+    
+    blocking = True
+    PRUNE_EVERY = 1000
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._takes = 0
+    
+    def _get_conn(self) -> sqlite3.Connection:
+        """Lazily open the database in autocommit mode; transactions are explicit"""
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.db_path))
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+        return self._conn
+    
+    def take(self, key: str, cost: float, capacity: float, refill_per_second: float) -> float:
+        # Wall clock, since monotonic clocks aren't comparable across processes
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            # IMMEDIATE takes the write lock up front, so concurrent workers can't both spend the same tokens
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, updated_at = row if row is not None else (capacity, now)
+                tokens, retry_after = _take(tokens, updated_at, now, cost, capacity, refill_per_second)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now)
+                )
+                self._takes += 1
+                if self._takes % self.PRUNE_EVERY == 0:
+                    conn.execute(
+                        "DELETE FROM rate_limit_buckets WHERE updated_at < ?",
+                        (now - capacity / refill_per_second,)
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return retry_after
+
+
+class RateLimiter:
+    """Charges request costs to per-user token buckets"""
+    
+    def __init__(self, enabled: bool, capacity: float, refill_per_second: float, store):
+        self.enabled = enabled
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.store = store
+        self.allowed = 0
+        self.rejected = 0
+    
+    async def take(self, user_id: int, cost: float) -> float:
+        """Spend cost from the user's bucket; returns 0, or the seconds until it can be afforded"""
+        if not self.enabled:
+            return 0.0
+        # A request costing more than the whole bucket needs a full bucket
+        cost = min(cost, self.capacity)
+        args = (f"user:{user_id}", cost, self.capacity, self.refill_per_second)
+        if self.store.blocking:
+            retry_after = await asyncio.to_thread(self.store.take, *args)
+        else:
+            retry_after = self.store.take(*args)
+        
+        if retry_after > 0:
+            self.rejected += 1
+        else:
+            self.allowed += 1
+        return retry_after
+    
+    async def enforce(self, user_id: int, cost: float) -> None:
+        """Spend cost or raise a 429 with Retry-After"""
+        retry_after = await self.take(user_id, cost)
+        if retry_after > 0:
+            raise RateLimitExceeded(retry_after)
+    
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "store": "sqlite" if isinstance(self.store, SQLiteBucketStore) else "memory",
+            "capacity": self.capacity,
+            "refill_per_second": self.refill_per_second,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+
+def _create_store():
+    if settings.RATE_LIMIT_STORE == "sqlite":
+        return SQLiteBucketStore(settings.RATE_LIMIT_DB_PATH)
+    return MemoryBucketStore()
+
+
+rate_limiter = RateLimiter(
+    enabled=settings.RATE_LIMIT_ENABLED,
+    capacity=settings.RATE_LIMIT_CAPACITY,
+    refill_per_second=settings.RATE_LIMIT_REFILL_PER_SECOND,
+    store=_create_store()
+)
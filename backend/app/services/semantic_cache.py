@@ -0,0 +1,248 @@
+import math
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..models import Question
+from .write_behind import write_behind
+
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "explain", "for",
+    "from", "i", "in", "is", "it", "me", "of", "on", "or", "please", "tell", "the",
+    "to", "was", "with", "you", "your"
+}
+
+# "When was X born?" and "Where was X born?" need different answers, so
+# questions only match others asking with the same question words
+INTERROGATIVES = ("how", "what", "when", "where", "which", "who", "why")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class _Partition:
+    """Hashed TF-IDF vectors for questions sharing one explanation_type"""
+    
+    def __init__(self, dimensions: int, capacity: int):
+        self.dimensions = dimensions
+        self.capacity = capacity
+        # Sublinear term frequencies, one row per indexed question. Rows are
+        # preallocated in doubling blocks and reused as a ring buffer when full
+        self.tf = np.zeros((min(64, capacity), dimensions), dtype=np.float32)
+        # Bitmask of the INTERROGATIVES in each row's question
+        self.asks = np.zeros(self.tf.shape[0], dtype=np.uint8)
+        # None marks a row dropped because its question no longer exists
+        self.question_ids: List[Optional[int]] = []
+        self.next_slot = 0
+        # Number of indexed questions containing each hashed feature
+        self.df = np.zeros(dimensions, dtype=np.float32)
+        # Cached IDF-weighted, L2-normalized copy of tf used for lookups
+        self.weighted: Optional[np.ndarray] = None
+        self.idf: Optional[np.ndarray] = None
+        self.adds_since_reweight = 0
+    
+    def __len__(self) -> int:
+        return len(self.question_ids)
+    
+    def _compute_idf(self) -> np.ndarray:
+        n = max(len(self), 1)
+        return np.log((1.0 + n) / (1.0 + self.df)).astype(np.float32) + 1.0
+    
+    @staticmethod
+    def _normalize(rows: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return rows / norms
+    
+    def _reweight(self) -> None:
+        self.idf = self._compute_idf()
+        self.weighted = self._normalize(self.tf[:len(self)] * self.idf)
+        self.adds_since_reweight = 0
+    
+    def add(self, question_id: int, vector: np.ndarray, asks: int) -> None:
+        present = (vector > 0).astype(np.float32)
+        if len(self) < self.capacity:
+            slot = len(self)
+            if slot == self.tf.shape[0]:
+                grown = np.zeros((min(slot * 2, self.capacity), self.dimensions), dtype=np.float32)
+                grown[:slot] = self.tf
+                self.tf = grown
+                self.asks = np.concatenate([self.asks, np.zeros(grown.shape[0] - slot, dtype=np.uint8)])
+            self.tf[slot] = vector
+            self.asks[slot] = asks
+            self.question_ids.append(question_id)
+        else:
+            # Overwrite the oldest entry once the partition is full
+            slot = self.next_slot
+            self.df -= (self.tf[slot] > 0).astype(np.float32)
+            self.tf[slot] = vector
+            self.asks[slot] = asks
+            self.question_ids[slot] = question_id
+            self.next_slot = (slot + 1) % self.capacity
+        self.df += present
+        
+        if self.weighted is None or self.idf is None:
+            return
+        # IDF drifts slowly, so append with the current weights and only
+        # recompute the whole matrix once enough new rows have accumulated
+        self.adds_since_reweight += 1
+        if self.adds_since_reweight > max(16, len(self) // 10) or slot > self.weighted.shape[0]:
+            self.weighted = None
+            return
+        row = self._normalize((vector * self.idf)[np.newaxis, :])
+        if slot < self.weighted.shape[0]:
+            self.weighted[slot] = row[0]
+        else:
+            self.weighted = np.vstack([self.weighted, row])
+    
+    def remove(self, question_id: int) -> bool:
+        """Zero out a question's row; the slot is reused when the ring wraps"""
+        try:
+            slot = self.question_ids.index(question_id)
+        except ValueError:
+            return False
+        self.df -= (self.tf[slot] > 0).astype(np.float32)
+        self.tf[slot] = 0
+        self.question_ids[slot] = None
+        if self.weighted is not None and slot < self.weighted.shape[0]:
+            self.weighted[slot] = 0
+        return True
+    
+    def live_count(self) -> int:
+        return sum(1 for question_id in self.question_ids if question_id is not None)
+    
+    def best_match(self, vector: np.ndarray, asks: int) -> Optional[Tuple[int, float]]:
+        if not len(self):
+            return None
+        if self.weighted is None or self.idf is None:
+            self._reweight()
+        query = self._normalize(vector * self.idf)
+        similarities = self.weighted @ query
+        similarities[self.asks[:len(similarities)] != asks] = -1.0
+        best = int(np.argmax(similarities))
+        if self.question_ids[best] is None:
+            return None
+        return self.question_ids[best], float(similarities[best])
+
+
+class SemanticQuestionCache:
+    """Local similarity index over previously answered questions.
+
+    Questions are embedded as hashed TF-IDF vectors (word unigrams and
+    bigrams) held in NumPy arrays, partitioned by explanation_type. A lookup
+    is a single matrix-vector product on the CPU.
+    """
+    
+    def __init__(self, dimensions: int, threshold: float, max_entries: int):
+        self.dimensions = dimensions
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._partitions: Dict[str, _Partition] = {}
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+    
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """Lowercased content words plus adjacent-word bigrams"""
+        words = [w for w in TOKEN_PATTERN.findall(text.lower()) if w not in STOPWORDS]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    
+    def vectorize(self, text: str) -> np.ndarray:
+        """Hash tokens into a fixed-width sublinear term-frequency vector"""
+        counts: Dict[int, int] = {}
+        for token in self.tokenize(text):
+            bucket = zlib.crc32(token.encode("utf-8")) % self.dimensions
+            counts[bucket] = counts.get(bucket, 0) + 1
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for bucket, count in counts.items():
+            vector[bucket] = 1.0 + math.log(count)
+        return vector
+    
+    @staticmethod
+    def question_words(text: str) -> int:
+        """Bitmask of the INTERROGATIVES used in text"""
+        words = set(TOKEN_PATTERN.findall(text.lower()))
+        return sum(1 << i for i, word in enumerate(INTERROGATIVES) if word in words)
+    
+    def _partition(self, explanation_type: str) -> _Partition:
+        if explanation_type not in self._partitions:
+            self._partitions[explanation_type] = _Partition(self.dimensions, self.max_entries)
+        return self._partitions[explanation_type]
+    
+    def add(self, question_id: int, question_text: str, explanation_type: str) -> None:
+        """Index an answered question"""
+        vector = self.vectorize(question_text)
+        if not vector.any():
+            return
+        self._partition(explanation_type).add(question_id, vector, self.question_words(question_text))
+    
+    def lookup(self, question_text: str, explanation_type: str) -> Optional[Tuple[int, float]]:
+        """Return (question_id, similarity) of the closest match above the threshold"""
+        vector = self.vectorize(question_text)
+        partition = self._partitions.get(explanation_type)
+        match = partition.best_match(vector, self.question_words(question_text)) if partition is not None and vector.any() else None
+        if match is None or match[1] < self.threshold:
+            return None
+        return match
+    
+    def remove(self, question_id: int, explanation_type: str) -> None:
+        """Drop a question from the index"""
+        partition = self._partitions.get(explanation_type)
+        if partition is not None:
+            partition.remove(question_id)
+    
+    def load(self, db: Session) -> None:
+        """Build the index from the most recently answered questions"""
+        self._partitions = {}
+        rows = db.query(Question.id, Question.question_text, Question.explanation_type)\
+            .order_by(Question.id.desc())\
+            .limit(self.max_entries * 3)\
+            .all()
+        for question_id, question_text, explanation_type in reversed(rows):
+            self.add(question_id, question_text, explanation_type or "simple")
+        self.loaded = True
+    
+    def find_similar(self, db: Session, question_text: str, explanation_type: str) -> Optional[Tuple[Question, float]]:
+        """Return a stored Question close enough to reuse its answer, with its similarity"""
+        if not self.loaded:
+            self.load(db)
+        match = self.lookup(question_text, explanation_type)
+        if match is None:
+            self.misses += 1
+            return None
+        question_id, similarity = match
+        # Rows still queued by write-behind are not in the database yet
+        question = write_behind.pending(Question, question_id)
+        if question is None:
+            question = db.query(Question).filter(Question.id == question_id).first()
+        if question is None:
+            # Deleted since it was indexed: only a loaded row counts as a hit
+            self.remove(question_id, explanation_type)
+            self.stale += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        return question, similarity
+    
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": sum(p.live_count() for p in self._partitions.values()),
+            "partitions": {name: p.live_count() for name, p in self._partitions.items()},
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+semantic_cache = SemanticQuestionCache(
+    dimensions=settings.SEMANTIC_CACHE_DIMENSIONS,
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,58 @@
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one upstream call.
+
+    The first caller for a key starts the work; callers that arrive while it
+    is in flight await the same task. Every caller gets its own deep copy of
+    the result, so one request mutating its response can't affect another.
+    """
+    
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+        self._waiters: Dict[str, int] = {}
+    
+    async def run(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        """Run work() once per key across concurrent callers and share its result"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            self._waiters[key] += 1
+            self.max_waiters = max(self.max_waiters, self._waiters[key])
+        else:
+            # The work runs as its own task so a caller disconnecting
+            # doesn't cancel the upstream call for everyone else
+            task = asyncio.ensure_future(work())
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            self.leaders += 1
+            task.add_done_callback(lambda _: self._forget(key, task))
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result)
+    
+    def _forget(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._waiters[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller went away
+            task.exception()
+    
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.leaders,
+            "coalesced_calls": self.coalesced,
+            "max_waiters": self.max_waiters,
+            "coalesced_ratio": round(self.coalesced / calls, 4) if calls else 0.0,
+        }
+
+
+single_flight = SingleFlight()
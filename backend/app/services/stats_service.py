@@ -0,0 +1,156 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Optional
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from ..models import User, Question, Quiz, QuizAttempt, Note, VoiceSession, UserStat
+
+
+# Model -> user_stats counter column kept in step with its row count
+COUNTED_MODELS = {
+    Question: "total_questions",
+    Quiz: "total_quizzes",
+    QuizAttempt: "total_quiz_attempts",
+    Note: "total_notes",
+    VoiceSession: "total_voice_sessions",
+}
+
+STAT_COLUMNS = list(COUNTED_MODELS.values()) + ["quiz_score_sum"]
+
+
+class StatsService:
+    """Keeps user_stats in step with the rows it counts.
+    
+    Every ORM flush that inserts or deletes a counted row applies the
+    matching delta to the owner's user_stats row on the flush's own
+    connection, so counters commit or roll back with the change itself.
+    Bulk query.delete()/update() bypass the ORM and need a reconcile().
+    """
+    
+    @staticmethod
+    def _collect_deltas(session: Session) -> Dict[int, Dict[str, float]]:
+        deltas: Dict[int, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for objects, sign in ((session.new, 1), (session.deleted, -1)):
+            for obj in objects:
+                column = COUNTED_MODELS.get(type(obj))
+                if column is None or obj.user_id is None:
+                    continue
+                deltas[obj.user_id][column] += sign
+                if isinstance(obj, QuizAttempt):
+                    deltas[obj.user_id]["quiz_score_sum"] += sign * (obj.score or 0.0)
+        return deltas
+    
+    def after_flush(self, session: Session, flush_context) -> None:
+        """Apply this flush's inserts and deletes to the owners' counters"""
+        new_users = [obj.id for obj in session.new if isinstance(obj, User)]
+        deleted_users = {obj.id for obj in session.deleted if isinstance(obj, User)}
+        deltas = self._collect_deltas(session)
+        if not (new_users or deleted_users or deltas):
+            return
+        
+        conn = session.connection()
+        table = UserStat.__table__
+        if new_users:
+            conn.execute(insert(table), [{"user_id": user_id} for user_id in new_users])
+        if deleted_users:
+            conn.execute(delete(table).where(table.c.user_id.in_(deleted_users)))
+        
+        missing = []
+        for user_id, changes in deltas.items():
+            if user_id in deleted_users:
+                continue
+            values = {column: table.c[column] + delta for column, delta in changes.items() if delta}
+            if not values:
+                continue
+            values["updated_at"] = func.now()
+            result = conn.execute(update(table).where(table.c.user_id == user_id).values(**values))
+            if result.rowcount == 0:
+                missing.append(user_id)
+        if missing:
+            # No counter row yet: count from scratch, which already includes this flush
+            self.reconcile(conn, missing)
+    
+    @staticmethod
+    def compute(conn: Connection, user_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, float]]:
+        """Aggregate the counters from the source tables"""
+        user_query = select(User.__table__.c.id)
+        if user_ids is not None:
+            user_query = user_query.where(User.__table__.c.id.in_(list(user_ids)))
+        stats = {
+            user_id: {column: 0 for column in STAT_COLUMNS}
+            for user_id in conn.execute(user_query).scalars()
+        }
+        if not stats:
+            return stats
+        
+        for model, column in COUNTED_MODELS.items():
+            source = model.__table__
+            aggregates = [source.c.user_id, func.count()]
+            if model is QuizAttempt:
+                aggregates.append(func.coalesce(func.sum(source.c.score), 0.0))
+            query = select(*aggregates).group_by(source.c.user_id)
+            if user_ids is not None:
+                query = query.where(source.c.user_id.in_(list(stats)))
+            for row in conn.execute(query):
+                if row[0] not in stats:
+                    continue
+                stats[row[0]][column] = row[1]
+                if model is QuizAttempt:
+                    stats[row[0]]["quiz_score_sum"] = float(row[2])
+        return stats
+    
+    def reconcile(self, conn: Connection, user_ids: Optional[Iterable[int]] = None) -> int:
+        """Recount from the source tables and fix rows that drifted; returns rows written"""
+        expected = self.compute(conn, user_ids)
+        table = UserStat.__table__
+        current_query = select(table)
+        if user_ids is not None:
+            current_query = current_query.where(table.c.user_id.in_(list(expected)))
+        current = {row.user_id: row for row in conn.execute(current_query)}
+        
+        fixed = 0
+        for user_id, values in expected.items():
+            row = current.get(user_id)
+            if row is None:
+                conn.execute(insert(table).values(user_id=user_id, **values))
+            elif any(abs(getattr(row, column) - value) > 1e-6 for column, value in values.items()):
+                conn.execute(
+                    update(table)
+                    .where(table.c.user_id == user_id)
+                    .values(updated_at=func.now(), **values)
+                )
+            else:
+                continue
+            fixed += 1
+        
+        # Counter rows whose user no longer exists
+        if user_ids is None:
+            orphans = set(current) - set(expected)
+            if orphans:
+                conn.execute(delete(table).where(table.c.user_id.in_(orphans)))
+                fixed += len(orphans)
+        return fixed
+    
+    def missing_user_ids(self, conn: Connection) -> list:
+        """Users that have no user_stats row yet"""
+        users = User.__table__
+        table = UserStat.__table__
+        return list(conn.execute(
+            select(users.c.id)
+            .outerjoin(table, table.c.user_id == users.c.id)
+            .where(table.c.user_id.is_(None))
+        ).scalars())
+    
+    def get(self, db: Session, user_id: int) -> UserStat:
+        """The user's counters, created from a full count if missing"""
+        stats = db.get(UserStat, user_id)
+        if stats is None:
+            self.reconcile(db.connection(), [user_id])
+            db.commit()
+            stats = db.get(UserStat, user_id)
+        return stats
+
+
+stats_service = StatsService()
+
+event.listen(Session, "after_flush", stats_service.after_flush)
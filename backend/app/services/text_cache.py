@@ -0,0 +1,145 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from ..config import settings
+
+
+class ExtractedTextCache:
+    """Disk cache of extracted document text keyed by the upload's SHA-256.
+
+    Each entry is one UTF-8 file in the cache directory. An in-memory index
+    ordered by last use enforces the byte budget, evicting least recently used
+    files first. Hits touch the file's mtime, so recency survives restarts
+    when the index is rebuilt from the directory.
+    """
+    
+    SUFFIX = ".txt"
+    
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        self.write_errors = 0
+    
+    @staticmethod
+    def make_key(content_sha256: str, file_ext: str, max_pages: int, max_chars: int) -> str:
+        """Key on the content plus the limits that shaped the extracted text"""
+        raw = f"{content_sha256}:{file_ext}:{max_pages}:{max_chars}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+    
+    def _load(self) -> None:
+        """Rebuild the index from the directory, oldest first"""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(self.SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(self.SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+        self._loaded = True
+        self._evict()
+    
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+    
+    def get(self, key: str, upload_size: int) -> Optional[str]:
+        """Cached text for key; upload_size is credited to bytes_saved on a hit"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+        
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as cached:
+                text = cached.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory
+            with self._lock:
+                self._size -= self._index.pop(key, 0)
+                self.misses += 1
+            return None
+        
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += upload_size
+        return text
+    
+    def put(self, key: str, text: str) -> None:
+        """Store text under key, evicting least recently used entries over the budget"""
+        data = text.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load()
+        
+        # Write then rename, so readers never see a partial file. The cache is
+        # best effort: a full or missing directory must not fail the upload
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as tmp_file:
+                    tmp_file.write(data)
+                os.replace(tmp_path, self._path(key))
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            with self._lock:
+                self.write_errors += 1
+            return
+        
+        with self._lock:
+            self._size -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._size += len(data)
+            self._evict()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "evictions": self.evictions,
+                "write_errors": self.write_errors,
+            }
+
+
+text_cache = ExtractedTextCache(
+    directory=settings.TEXT_CACHE_DIR,
+    max_bytes=settings.TEXT_CACHE_MAX_BYTES
+)
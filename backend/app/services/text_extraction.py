@@ -0,0 +1,72 @@
+"""Document parsing run inside extraction worker processes.
+
+Only parser imports live here so spawned workers start quickly. Text is
+collected page by page into a list and joined once, and parsing stops early
+at the page cap, the character cap or the deadline. Small uploads arrive as
+bytes; spooled ones as a temp file path, which PDFs read through mmap so
+the file is paged in on demand instead of copied into memory.
+"""
+import io
+import mmap
+import time
+from typing import Any, Dict, Iterable, Union
+import PyPDF2
+from docx import Document
+
+
+def _collect(pieces: Iterable[str], max_units: int, max_chars: int, deadline: float) -> Dict[str, Any]:
+    """Join pieces until a cap or the deadline is reached"""
+    started = time.time()
+    parts = []
+    chars = 0
+    truncated = False
+    timed_out = False
+    for piece in pieces:
+        if len(parts) >= max_units or chars >= max_chars:
+            truncated = True
+            break
+        if time.time() > deadline:
+            timed_out = True
+            break
+        piece = piece or ""
+        parts.append(piece)
+        chars += len(piece) + 1
+    
+    text = "\n".join(parts)
+    if len(text) > max_chars:
+        text = text[:max_chars]
+        truncated = True
+    return {
+        "text": text.strip(),
+        "units": len(parts),
+        "truncated": truncated,
+        "timed_out": timed_out,
+        "started_at": started,
+        "parse_seconds": time.time() - started,
+    }
+
+
+def extract_pdf(source: Union[bytes, str], max_pages: int, max_chars: int, deadline: float) -> Dict[str, Any]:
+    """Extract PDF text one page at a time"""
+    if isinstance(source, bytes):
+        reader = PyPDF2.PdfReader(io.BytesIO(source))
+        pages = (page.extract_text() for page in reader.pages)
+        return _collect(pages, max_pages, max_chars, deadline)
+    
+    with open(source, "rb") as pdf_file, mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        reader = PyPDF2.PdfReader(mapped)
+        pages = (page.extract_text() for page in reader.pages)
+        return _collect(pages, max_pages, max_chars, deadline)
+
+
+def extract_docx(source: Union[bytes, str], max_pages: int, max_chars: int, deadline: float) -> Dict[str, Any]:
+    """Extract DOCX text one paragraph at a time; only the character cap applies"""
+    doc = Document(io.BytesIO(source) if isinstance(source, bytes) else source)
+    paragraphs = (paragraph.text for paragraph in doc.paragraphs)
+    return _collect(paragraphs, len(doc.paragraphs), max_chars, deadline)
+
+
+EXTRACTORS = {
+    ".pdf": extract_pdf,
+    ".docx": extract_docx,
+}
@@ -0,0 +1,206 @@
+"""Shared protection for upstream model calls.
+
+AdaptiveLimiter sizes concurrency with AIMD: each success grows the limit
+by about one per window of calls, and each rate-limit or availability error
+halves it. CircuitBreaker fails calls fast while the upstream keeps failing
+and lets one probe through after a cool-down. RetryBudget caps retries to a
+share of calls, so retries can't multiply load during an outage.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+RATE_LIMITED = "rate_limited"
+UNAVAILABLE = "unavailable"
+CLIENT_ERROR = "client_error"
+
+
+def classify_error(error: BaseException) -> str:
+    """429 is rate limiting, other 4xx are the caller's fault, anything else is unavailability"""
+    code = getattr(error, "code", None)
+    if code == 429:
+        return RATE_LIMITED
+    if isinstance(code, int) and 400 <= code < 500:
+        return CLIENT_ERROR
+    # 5xx, timeouts and connection failures
+    return UNAVAILABLE
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter, so retries from many callers spread out"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"AI service temporarily unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit; callers over the limit wait in FIFO order"""
+    
+    def __init__(self, initial_limit: int, min_limit: int, max_limit: int, decrease_ratio: float = 0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_ratio = decrease_ratio
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+    
+    async def acquire(self) -> float:
+        """Wait for a slot; returns the start time to pass back on release"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return time.monotonic()
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as we were cancelled: pass it on
+                self.on_ignore()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        return time.monotonic()
+    
+    def on_success(self) -> None:
+        """Release a slot after a successful call: additive increase"""
+        self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        self.increases += 1
+        self._release()
+    
+    def on_dropped(self, started_at: float) -> None:
+        """Release a slot after an overload signal: multiplicative decrease.
+
+        Calls that started before the last decrease saw the old limit, so a
+        burst of failures from one overload shrinks the limit only once.
+        """
+        if started_at >= self._last_decrease and self.limit > self.min_limit:
+            self.limit = max(float(self.min_limit), self.limit * self.decrease_ratio)
+            self._last_decrease = time.monotonic()
+            self.decreases += 1
+        self._release()
+    
+    def on_ignore(self) -> None:
+        """Release a slot without adjusting the limit"""
+        self._release()
+    
+    def _release(self) -> None:
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+
+class CircuitBreaker:
+    """Closed, open or half-open, driven by consecutive availability failures"""
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int, reset_seconds: float, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.times_opened = 0
+        self.rejected = 0
+    
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go upstream now"""
+        if self.state == self.OPEN:
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(remaining)
+            self.state = self.HALF_OPEN
+            self._probes = 0
+        
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.reset_seconds)
+            self._probes += 1
+    
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.state = self.CLOSED
+    
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+    
+    def record_neutral(self) -> None:
+        """The call said nothing about availability (rate limited, bad request, cancelled)"""
+        if self.state == self.HALF_OPEN:
+            self._probes = max(self._probes - 1, 0)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class RetryBudget:
+    """Each call deposits ratio tokens and each retry spends one, up to max_tokens banked"""
+    
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.retries = 0
+        self.denied = 0
+    
+    def record_call(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+    
+    def try_spend(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.retries += 1
+            return True
+        self.denied += 1
+        return False
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tokens": round(self.tokens, 2),
+            "max_tokens": self.max_tokens,
+            "retries": self.retries,
+            "denied": self.denied,
+        }
@@ -0,0 +1,86 @@
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models import VoiceSession
+from .ai_service import ai_service
+from .voice_service import voice_service
+
+
+class VoiceContextManager:
+    """Bounded prompt context for voice sessions.
+    
+    Older turns are folded into a rolling summary stored on the session every
+    `summarize_every` turns; the prompt gets that summary plus the newest
+    unsummarized turns that fit in the token budget. Prompt size stays flat
+    however long the session runs.
+    """
+    
+    def __init__(self, token_budget: int, summarize_every: int, keep_recent: int):
+        self.token_budget = token_budget
+        self.summarize_every = summarize_every
+        self.keep_recent = keep_recent
+    
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough token count (about four characters per token)"""
+        return len(text) // 4 + 1
+    
+    async def build_context(self, db: AsyncSession, session: VoiceSession) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """Return (rolling summary, recent turns within the token budget)"""
+        # At most one summarization interval plus the kept tail is unsummarized
+        candidates = await voice_service.get_recent_messages(
+            db,
+            session.id,
+            self.summarize_every + self.keep_recent,
+            after_seq=session.summarized_through or 0
+        )
+        
+        budget = self.token_budget
+        if session.context_summary:
+            budget -= self.estimate_tokens(session.context_summary)
+        
+        window: List[Dict[str, str]] = []
+        for message in reversed(candidates):
+            cost = self.estimate_tokens(message["content"])
+            if window and cost > budget:
+                break
+            window.append(message)
+            budget -= cost
+        window.reverse()
+        
+        return session.context_summary, window
+    
+    def needs_refresh(self, session: VoiceSession) -> bool:
+        """Whether enough turns accumulated since the last summary"""
+        unsummarized = (session.message_count or 0) - (session.summarized_through or 0)
+        return unsummarized >= self.summarize_every + self.keep_recent
+    
+    async def refresh_summary(self, session_id: int) -> None:
+        """Fold all but the newest `keep_recent` turns into the session summary"""
+        async with AsyncSessionLocal() as db:
+            session = await db.get(VoiceSession, session_id)
+            if session is None or not self.needs_refresh(session):
+                return
+            
+            previous_through = session.summarized_through or 0
+            through = session.message_count - self.keep_recent
+            turns = await voice_service.get_messages_between(db, session_id, previous_through, through)
+            summary = await ai_service.summarize_conversation(session.mode, session.context_summary, turns)
+            
+            # Conditional update so a concurrent refresh can't move the summary backwards
+            await db.execute(
+                update(VoiceSession)
+                .where(VoiceSession.id == session_id, VoiceSession.summarized_through == previous_through)
+                .values(context_summary=summary, summarized_through=through)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+
+voice_context = VoiceContextManager(
+    token_budget=settings.VOICE_CONTEXT_TOKEN_BUDGET,
+    summarize_every=settings.VOICE_SUMMARY_EVERY,
+    keep_recent=settings.VOICE_SUMMARY_KEEP_RECENT
+)
@@ -0,0 +1,59 @@
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from ..models import VoiceSession, VoiceSessionMessage
+
+
+class VoiceService:
+    @staticmethod
+    async def append_message(db: AsyncSession, session: VoiceSession, role: str, content: str) -> VoiceSessionMessage:
+        """Add one turn to a session without touching earlier messages"""
+        # Increment in the database so concurrent requests on one session never share a seq
+        seq = (await db.execute(
+            update(VoiceSession)
+            .where(VoiceSession.id == session.id)
+            .values(message_count=VoiceSession.message_count + 1)
+            .returning(VoiceSession.message_count)
+        )).scalar_one()
+        set_committed_value(session, "message_count", seq)
+        message = VoiceSessionMessage(
+            session_id=session.id,
+            seq=seq,
+            role=role,
+            content=content,
+            created_at=datetime.utcnow()
+        )
+        db.add(message)
+        return message
+    
+    @staticmethod
+    async def get_recent_messages(db: AsyncSession, session_id: int, limit: int, after_seq: int = 0) -> List[Dict[str, str]]:
+        """Fetch only the last `limit` turns of a session after `after_seq`, oldest first"""
+        rows = (await db.execute(
+            select(VoiceSessionMessage)
+            .where(VoiceSessionMessage.session_id == session_id, VoiceSessionMessage.seq > after_seq)
+            .order_by(VoiceSessionMessage.seq.desc())
+            .limit(limit)
+        )).scalars().all()
+        
+        return [row.to_dict() for row in reversed(rows)]
+    
+    @staticmethod
+    async def get_messages_between(db: AsyncSession, session_id: int, after_seq: int, through_seq: int) -> List[Dict[str, str]]:
+        """Fetch turns with after_seq < seq <= through_seq, oldest first"""
+        rows = (await db.execute(
+            select(VoiceSessionMessage)
+            .where(
+                VoiceSessionMessage.session_id == session_id,
+                VoiceSessionMessage.seq > after_seq,
+                VoiceSessionMessage.seq <= through_seq
+            )
+            .order_by(VoiceSessionMessage.seq)
+        )).scalars().all()
+        
+        return [row.to_dict() for row in rows]
+
+
+voice_service = VoiceService()
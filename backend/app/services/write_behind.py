@@ -0,0 +1,196 @@
+"""Write-behind persistence for AI results.
+
+With WRITE_BEHIND_ENABLED, new Question, Note and Quiz rows get their
+primary key and created_at in process and the response is returned without
+waiting for a commit. A background task inserts queued rows in batches, one
+writer transaction per batch instead of one per row. Before a user's reads,
+that user's pending rows are flushed so they always see their own writes.
+
+Ids are allocated from MAX(id) at startup, so the queue requires a single
+application process that owns a SQLite database.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import AsyncSessionLocal, IS_SQLITE
+from ..models import Note, Question, Quiz
+
+logger = logging.getLogger(__name__)
+
+QUEUED_MODELS = (Question, Quiz, Note)
+
+# Runs on the sync session inside the batch transaction, before the row is inserted
+BeforeInsert = Callable[[Session], Any]
+
+
+class _PendingWrite:
+    __slots__ = ("obj", "before_insert")
+    
+    def __init__(self, obj: Any, before_insert: Optional[BeforeInsert]):
+        self.obj = obj
+        self.before_insert = before_insert
+
+
+class WriteBehindQueue:
+    """Batches inserts of AI results on a background task"""
+    
+    def __init__(self, enabled: bool, batch_size: int, flush_interval_ms: int):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.active = False
+        self._closing = False
+        self._next_ids: Dict[type, int] = {}
+        self._queue: List[_PendingWrite] = []
+        self._pending_by_user: Dict[int, int] = {}
+        self._pending_rows: Dict[Tuple[type, int], Any] = {}
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.rows_written = 0
+        self.batches = 0
+        self.failed = 0
+    
+    async def start(self) -> None:
+        """Allocate ids from the current table maxima; call once at startup after migrations"""
+        if not self.enabled:
+            return
+        if not IS_SQLITE:
+            logger.warning("Write-behind persistence needs a single-process SQLite database; disabled")
+            return
+        async with AsyncSessionLocal() as db:
+            for model in QUEUED_MODELS:
+                self._next_ids[model] = ((await db.execute(select(func.max(model.id)))).scalar() or 0) + 1
+        self.active = True
+    
+    def _allocate_id(self, model: type) -> int:
+        next_id = self._next_ids[model]
+        self._next_ids[model] = next_id + 1
+        return next_id
+    
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._flush_lock = self._flush_lock or asyncio.Lock()
+            self._wake = self._wake or asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+    
+    def enqueue(self, obj: Any, before_insert: Optional[BeforeInsert] = None) -> Any:
+        """Give obj its id and created_at now and insert it later"""
+        self._ensure_worker()
+        obj.id = self._allocate_id(type(obj))
+        obj.created_at = datetime.utcnow()
+        self._queue.append(_PendingWrite(obj, before_insert))
+        self._pending_by_user[obj.user_id] = self._pending_by_user.get(obj.user_id, 0) + 1
+        self._pending_rows[(type(obj), obj.id)] = obj
+        self._wake.set()
+        return obj
+    
+    async def save(
+        self,
+        db: AsyncSession,
+        obj: Any,
+        before_insert: Optional[BeforeInsert] = None,
+        relationships: Sequence[str] = ()
+    ) -> Any:
+        """Queue obj when write-behind is active, otherwise insert and commit it on db"""
+        if self.active:
+            return self.enqueue(obj, before_insert)
+        
+        if before_insert is not None:
+            await db.run_sync(before_insert)
+        db.add(obj)
+        await db.commit()
+        await db.refresh(obj)
+        if relationships:
+            await db.refresh(obj, list(relationships))
+        return obj
+    
+    def pending(self, model: type, obj_id: int) -> Optional[Any]:
+        """A queued row not yet committed, for lookups by id that bypass a user's sync"""
+        return self._pending_rows.get((model, obj_id))
+    
+    async def sync_user(self, user_id: int) -> None:
+        """Read-your-writes: wait until the user's queued rows are committed"""
+        if self._pending_by_user.get(user_id):
+            await self.flush()
+    
+    async def _run(self) -> None:
+        while not self._closing:
+            await self._wake.wait()
+            self._wake.clear()
+            if not self._closing and len(self._queue) < self.batch_size:
+                # Let a burst accumulate into one transaction
+                await asyncio.sleep(self.flush_interval)
+            await self.flush()
+    
+    async def flush(self) -> None:
+        """Write every queued row, batch_size rows per transaction"""
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            while self._queue:
+                batch = self._queue[:self.batch_size]
+                del self._queue[:self.batch_size]
+                try:
+                    await self._write(batch)
+                except Exception:
+                    # Isolate the bad rows so one failure doesn't drop the whole batch
+                    for item in batch:
+                        try:
+                            await self._write([item])
+                        except Exception:
+                            self.failed += 1
+                            logger.exception("Write-behind insert failed for %s %s", type(item.obj).__name__, item.obj.id)
+                            self._release([item])
+                self.batches += 1
+    
+    async def _write(self, batch: List[_PendingWrite]) -> None:
+        async with AsyncSessionLocal() as db:
+            for item in batch:
+                if item.before_insert is not None:
+                    await db.run_sync(item.before_insert)
+            db.add_all([item.obj for item in batch])
+            await db.commit()
+        self.rows_written += len(batch)
+        self._release(batch)
+    
+    def _release(self, batch: List[_PendingWrite]) -> None:
+        for item in batch:
+            self._pending_rows.pop((type(item.obj), item.obj.id), None)
+            user_id = item.obj.user_id
+            remaining = self._pending_by_user.get(user_id, 0) - 1
+            if remaining > 0:
+                self._pending_by_user[user_id] = remaining
+            else:
+                self._pending_by_user.pop(user_id, None)
+    
+    async def close(self) -> None:
+        """Stop the background task and write whatever is still queued"""
+        self._closing = True
+        if self._worker is not None:
+            # Let the worker finish its current batch rather than cancelling it mid-write
+            self._wake.set()
+            await self._worker
+            self._worker = None
+        await self.flush()
+    
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.active,
+            "queued": len(self._queue),
+            "rows_written": self.rows_written,
+            "batches": self.batches,
+            "failed": self.failed,
+        }
+
+
+write_behind = WriteBehindQueue(
+    enabled=settings.WRITE_BEHIND_ENABLED,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval_ms=settings.WRITE_BEHIND_FLUSH_INTERVAL_MS
+)